@@ -1,13 +1,13 @@
 from cloudinary.templatetags import cloudinary
 from django.contrib import admin
 from django.contrib.auth.hashers import make_password
-from django.db.models import Avg, Count, Q
 from django.template.response import TemplateResponse
 from django.urls import path, reverse
 from django.utils.html import mark_safe
 from oauth2_provider.models import Application, AccessToken, RefreshToken
+from theses import stats
 from theses.models import Role, User, Ministry, Position, SchoolYear, Faculty, Major, Lecturer, Student, Council, \
-    CouncilDetail, Thesis, Criteria, ThesisCriteria, Score, Post, Like, Comment
+    CouncilDetail, Thesis, Criteria, ThesisCriteria, Score, Post, Like, Comment, ScoreSheetJob, OutboundEmail
 
 
 class MyAdminSite(admin.AdminSite):
@@ -25,23 +25,14 @@ class MyAdminSite(admin.AdminSite):
         ]
         return custom_urls + urls
 
+    # Đọc từ bảng thống kê ThesisStat thay vì GROUP BY trên bảng khóa luận mỗi lần xem
     def stats(self, request):
-        avg_score_by_school_year = Thesis.objects.values('school_year__name').annotate(avg_score=Avg('total_score'))
-
-        for item in avg_score_by_school_year:
-            item['avg_score'] = round(item['avg_score'], 2)
-
-        thesis_major_count = Major.objects.annotate(thesis_count=Count('thesis'))
-
-        result = Thesis.objects.values('school_year__name').annotate(
-            pass_count=Count('code', filter=Q(result=True)),
-            fail_count=Count('code', filter=Q(result=False)),
-        ).order_by('school_year__start_year')
+        by_school_year = stats.by_school_year()
 
         return TemplateResponse(request, 'admin/stats.html', {
-            'avg_score_by_school_year': avg_score_by_school_year,
-            'thesis_major_count': thesis_major_count,
-            'result': result
+            'avg_score_by_school_year': by_school_year,
+            'thesis_major_count': stats.count_by_major(),
+            'result': by_school_year
         })
 
 
@@ -137,6 +128,11 @@ class MyScoreAdmin(admin.ModelAdmin):
     list_display = ['id', 'thesis_criteria', 'council_detail', 'score_number']
 
 
+class MyScoreSheetJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'thesis', 'status', 'file', 'created_date', 'updated_date']
+    list_filter = ['status']
+
+
 class MyPostAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'content', 'created_date', 'updated_date', 'active']
     search_fields = ['content']
@@ -151,6 +147,12 @@ class MyCommentAdmin(admin.ModelAdmin):
     search_fields = ['content']
 
 
+class MyOutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'to', 'status', 'attempts', 'next_attempt_date', 'sent_date']
+    list_filter = ['status']
+    search_fields = ['subject', 'to']
+
+
 class MyApplicationAdmin(admin.ModelAdmin):
     list_display = ('name', 'client_id', 'user', 'client_type')
 
@@ -180,9 +182,11 @@ admin_site.register(Thesis, MyThesisAdmin)
 admin_site.register(Criteria, MyCriteriaAdmin)
 admin_site.register(ThesisCriteria, MyThesisCriteriaAdmin)
 admin_site.register(Score, MyScoreAdmin)
+admin_site.register(ScoreSheetJob, MyScoreSheetJobAdmin)
 admin_site.register(Post, MyPostAdmin)
 admin_site.register(Like, MyLikeAdmin)
 admin_site.register(Comment, MyCommentAdmin)
+admin_site.register(OutboundEmail, MyOutboundEmailAdmin)
 admin_site.register(Application, MyApplicationAdmin)
 admin_site.register(AccessToken, MyAccessTokenAdmin)
 admin_site.register(RefreshToken, MyRefreshTokenAdmin)
@@ -7,4 +7,7 @@ class ThesesConfig(AppConfig):
 
     def ready(self):
         import theses.signals
+        from theses import rendering
+
+        rendering.register_fonts()  # Đọc file font TTF một lần cho cả process
 
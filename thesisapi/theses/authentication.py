@@ -0,0 +1,76 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken
+
+
+def token_cache_key(token):
+    return 'auth:token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def user_version_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+# Xóa token khỏi cache (token bị thu hồi, hết hạn hoặc thay đổi)
+def invalidate_token(token):
+    cache.delete(token_cache_key(token))
+
+
+# Mọi token đã cache của user trở nên không hợp lệ (user hoặc vai trò thay đổi)
+def invalidate_user(user_id):
+    cache.delete(user_version_key(user_id))
+
+
+def bearer_token(request):
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'bearer':
+        return auth[1]
+    return None
+
+
+# OAuth2Authentication có cache: token hợp lệ được lưu dạng gọn (user id, vai trò, hạn dùng, scope, phiên bản user),
+# không lưu đối tượng AccessToken/User (tránh đưa mật khẩu đã băm vào cache). Request sau chỉ cần một truy vấn
+# lấy user theo id, không truy vấn bảng AccessToken.
+class CachedOAuth2Authentication(OAuth2Authentication):
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if token is None:
+            return super().authenticate(request)
+
+        cached = cache.get(token_cache_key(token))
+        if cached is not None:
+            result = self.from_cache(token, *cached)
+            if result is not None:
+                return result
+
+        result = super().authenticate(request)
+        if result is not None:
+            self.store(token, result[1])
+        return result
+
+    def from_cache(self, token, user_id, role_id, expires, scope, version):
+        if expires <= timezone.now() or version != cache.get(user_version_key(user_id)):
+            return None
+
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None or user.role_id != role_id:
+            return None
+        # AccessToken không lưu DB, chỉ dùng cho kiểm tra scope/hạn dùng (request.auth)
+        return user, AccessToken(token=token, user=user, expires=expires, scope=scope)
+
+    def store(self, token, access_token):
+        timeout = min(getattr(settings, 'OAUTH2_TOKEN_CACHE_TIMEOUT', 300),
+                      int((access_token.expires - timezone.now()).total_seconds()))
+        if timeout <= 0 or access_token.user is None:
+            return
+
+        user = access_token.user
+        version = cache.get_or_set(user_version_key(user.pk), uuid.uuid4().hex, None)
+        cache.set(token_cache_key(token), (user.pk, user.role_id, access_token.expires, access_token.scope, version),
+                  timeout)
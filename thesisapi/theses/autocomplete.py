@@ -0,0 +1,127 @@
+import bisect
+import threading
+import uuid
+
+from django.core.cache import cache
+from theses.models import Lecturer, Student
+from theses.text import fold
+
+VERSION_KEY = 'autocomplete:version'  # Đổi mỗi khi dữ liệu thay đổi để các process khác nạp lại chỉ mục
+
+KINDS = {Lecturer: 'lecturer', Student: 'student'}
+
+
+# Chỉ mục tiền tố trong bộ nhớ: danh sách (khóa, loại, id) đã sắp xếp, tìm bằng bisect.
+# Khóa gồm mã và các hậu tố theo từ của họ tên đã bỏ dấu ("nguyen van an", "van an", "an").
+class PrefixIndex:
+    def __init__(self, version=None):
+        self.keys = []
+        self.items = {}  # (loại, id) -> (mã, họ tên, các khóa)
+        self.version = version
+
+    @staticmethod
+    def keys_for(code, full_name):
+        words = fold(full_name).split()
+        return {fold(code)} | {' '.join(words[i:]) for i in range(len(words))}
+
+    def load(self, rows):
+        for kind, pk, code, full_name in rows:
+            keys = self.keys_for(code, full_name)
+            self.items[(kind, pk)] = (code, full_name, keys)
+            self.keys.extend((key, kind, pk) for key in keys)
+        self.keys.sort()
+
+    def add(self, kind, pk, code, full_name):
+        self.remove(kind, pk)
+        keys = self.keys_for(code, full_name)
+        self.items[(kind, pk)] = (code, full_name, keys)
+        for key in keys:
+            bisect.insort(self.keys, (key, kind, pk))
+
+    def remove(self, kind, pk):
+        item = self.items.pop((kind, pk), None)
+        if item is None:
+            return
+        for key in item[2]:
+            i = bisect.bisect_left(self.keys, (key, kind, pk))
+            if i < len(self.keys) and self.keys[i] == (key, kind, pk):
+                del self.keys[i]
+
+    def lookup(self, prefix, kinds, limit):
+        results = []
+        seen = set()
+        i = bisect.bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(results) < limit:
+            key, kind, pk = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            if kind in kinds and (kind, pk) not in seen:
+                seen.add((kind, pk))
+                code, full_name, keys = self.items[(kind, pk)]
+                results.append({'type': kind, 'id': pk, 'code': code, 'full_name': full_name})
+            i += 1
+        return results
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _rows():
+    for model, kind in KINDS.items():
+        for pk, code, full_name in model.objects.values_list('pk', 'code', 'full_name').iterator():
+            yield kind, pk, code, full_name
+
+
+# Nạp lại toàn bộ chỉ mục khi chưa có hoặc process khác đã thay đổi dữ liệu (phiên bản trong cache khác)
+def get_index():
+    global _index
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        if _index is None or version is None or _index.version != version:
+            if version is None:
+                cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+                version = cache.get(VERSION_KEY)
+            index = PrefixIndex(version)
+            index.load(_rows())
+            _index = index
+        return _index
+
+
+def lookup(q, kinds=None, limit=10):
+    prefix = fold(q)
+    if not prefix:
+        return []
+    index = get_index()
+    with _lock:
+        return index.lookup(prefix, set(kinds or KINDS.values()), limit)
+
+
+# Cập nhật chỉ mục của process hiện tại và báo cho các process khác (gọi sau khi transaction commit)
+def _apply(change):
+    new_version = uuid.uuid4().hex
+    with _lock:
+        in_sync = _index is not None and _index.version == cache.get(VERSION_KEY)
+        cache.set(VERSION_KEY, new_version, None)
+        if in_sync:
+            change(_index)
+            _index.version = new_version
+
+
+def update(instance):
+    kind = KINDS[type(instance)]
+    with _lock:
+        item = _index.items.get((kind, instance.pk)) if _index is not None else None
+        if item is not None and item[:2] == (instance.code, instance.full_name):
+            return  # Mã và họ tên không đổi (ví dụ chỉ gán khóa luận cho sinh viên)
+    _apply(lambda index: index.add(kind, instance.pk, instance.code, instance.full_name))
+
+
+def remove(model, pk):
+    _apply(lambda index: index.remove(KINDS[model], pk))
+
+
+def reset():
+    global _index
+    with _lock:
+        _index = None
@@ -0,0 +1,98 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def version_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+# Phiên bản dữ liệu của từng model (thời điểm thay đổi gần nhất, nano giây), lưu trong cache.
+# Chưa có trong cache (mới khởi động, bị xóa) thì coi như vừa thay đổi.
+def model_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+# Gọi từ signal sau khi transaction commit
+def bump(model):
+    cache.set(version_key(model), time.time_ns(), None)
+
+
+def etag_for(request, versions):
+    raw = '|'.join([request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] + [str(v) for v in versions])
+    return '"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+# Danh sách dữ liệu danh mục (ít thay đổi): ETag/Last-Modified tính từ phiên bản của các model trong cache_models,
+# trả 304 khi client đã có bản mới nhất mà không cần truy vấn bảng dữ liệu
+class ConditionalListMixin:
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        versions = model_versions(self.cache_models or [self.queryset.model])
+        etag = etag_for(request, versions)
+        last_modified = max(versions) // 10 ** 9
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=getattr(settings, 'REFERENCE_DATA_MAX_AGE', 60))
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+def tag_key(tag):
+    return f'tag:{tag}'
+
+
+# Tag dùng chung cho mọi bản ghi của model (ví dụ 'theses.position')
+def model_tag(model):
+    return model._meta.label_lower
+
+
+# Mỗi tag giữ một token ngẫu nhiên; xóa tag thì mọi kết quả được lưu với token cũ hết hiệu lực
+def tag_tokens(tags):
+    keys = [tag_key(tag) for tag in tags]
+    tokens = cache.get_many(keys)
+    missing = [key for key in keys if key not in tokens]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)  # add: không ghi đè token process khác vừa tạo
+        tokens.update(cache.get_many(missing))
+    return [tokens.get(key) for key in keys]
+
+
+# Lấy kết quả (queryset đã serialize, ...) từ cache, tính lại bằng compute() khi một trong các tag đã bị invalidate.
+# Token được đọc trước khi tính nên dữ liệu thay đổi trong lúc tính sẽ không được coi là mới nhất.
+def cached(key, tags, compute, timeout=None):
+    tokens = tag_tokens(tags)
+    entry = cache.get(f'query:{key}')
+    if entry is not None and entry[0] == tokens:
+        return entry[1]
+
+    value = compute()
+    cache.set(f'query:{key}', (tokens, value), timeout or getattr(settings, 'QUERY_CACHE_TIMEOUT', 300))
+    return value
+
+
+# Xóa các tag sau khi transaction commit (chạy ngay nếu không nằm trong transaction)
+def invalidate(*tags):
+    keys = [tag_key(tag) for tag in tags]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
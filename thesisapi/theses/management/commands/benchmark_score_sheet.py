@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from theses import rendering
+
+
+class Command(BaseCommand):
+    help = 'Compare score sheet render time with a cold font load (old behaviour) against the cached renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+
+    def sample_data(self):
+        return {
+            'code': 'KL001',
+            'name': 'Xây dựng hệ thống quản lý khóa luận tốt nghiệp',
+            'major': 'Khoa học máy tính',
+            'council': 'Hội đồng 1',
+            'total_score': 8.25,
+            'students': [['2151050001', 'Nguyễn Văn An', 'Khoa học máy tính'],
+                         ['2151050002', 'Trần Thị Bình', 'Khoa học máy tính']],
+            'instructors': [['GV001', 'Lê Văn Cường']],
+            'lecturers': [['Phạm Văn Dũng', 'Chủ tịch', 8.5], ['Hoàng Thị Em', 'Thư ký', 8.0],
+                          ['Võ Văn Phúc', 'Phản biện', 8.25]],
+        }
+
+    def measure(self, runs, setup=None):
+        data = self.sample_data()
+        start = time.perf_counter()
+        for _ in range(runs):
+            if setup:
+                setup()
+            rendering.render_score_sheet(data)
+        return (time.perf_counter() - start) * 1000 / runs
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+
+        cold = self.measure(runs, setup=lambda: rendering.register_fonts(force=True))
+        rendering.register_fonts()
+        warm = self.measure(runs)
+
+        self.stdout.write(f'cold (font reloaded per render): {cold:.2f} ms/render')
+        self.stdout.write(f'warm (font and layout cached):   {warm:.2f} ms/render')
+        self.stdout.write(self.style.SUCCESS(f'speedup: {cold / warm:.1f}x over {runs} runs'))
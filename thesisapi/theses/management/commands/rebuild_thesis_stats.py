@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from theses import stats
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the ThesisStat table from the Thesis table'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} thesis stat row(s)'))
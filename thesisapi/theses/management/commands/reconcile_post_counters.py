@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from theses.models import Post, Like, Comment
+
+
+def count_subquery(queryset):
+    rows = queryset.filter(post_id=OuterRef('pk')).values('post_id').annotate(c=Count('id')).values('c')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Recalculate Post.like_count and Post.comment_count that drifted from the Like/Comment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    # Số đếm thực tế tính bằng subquery ngay trong câu UPDATE: không ghi đè các cập nhật F() đồng thời
+    def counters(self):
+        return {'like_count': count_subquery(Like.objects.filter(active=True)),
+                'comment_count': count_subquery(Comment.objects.all())}
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = 0
+        last_id = 0
+
+        while True:
+            post_ids = list(Post.objects.filter(id__gt=last_id).order_by('id')
+                            .values_list('id', flat=True)[:batch_size])
+            if not post_ids:
+                break
+
+            counters = self.counters()
+            drifted = list(Post.objects.filter(id__in=post_ids)
+                           .annotate(actual_like_count=counters['like_count'],
+                                     actual_comment_count=counters['comment_count'])
+                           .filter(~Q(like_count=F('actual_like_count')) | ~Q(comment_count=F('actual_comment_count')))
+                           .values_list('id', flat=True))
+            if drifted:
+                Post.objects.filter(id__in=drifted).update(**self.counters())
+            fixed += len(drifted)
+            last_id = post_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {fixed} post counter(s)'))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from theses import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox in batches over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = 0
+            try:
+                while True:
+                    batch = outbox.send_pending(options['batch_size'])
+                    if not batch:
+                        break
+                    sent += batch
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                # Lỗi tạm thời (mất kết nối DB, ...) không làm dừng worker, thử lại ở lượt sau
+                self.stderr.write(f'Sending queued emails failed: {e}')
+
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} email(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
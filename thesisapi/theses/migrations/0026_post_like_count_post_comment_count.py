@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_post_counters(apps, schema_editor):
+    Post = apps.get_model('theses', 'Post')
+    Like = apps.get_model('theses', 'Like')
+    Comment = apps.get_model('theses', 'Comment')
+
+    def count_of(model, **filters):
+        rows = (model.objects.filter(post=OuterRef('pk'), **filters).order_by()
+                .values('post').annotate(c=Count('id')).values('c'))
+        return Coalesce(Subquery(rows), 0)
+
+    Post.objects.update(like_count=count_of(Like, active=True), comment_count=count_of(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0025_alter_thesis_report_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='council',
+            name='description',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='thesis',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='theses.thesis'),
+        ),
+        migrations.RunPython(fill_post_counters, migrations.RunPython.noop),
+    ]
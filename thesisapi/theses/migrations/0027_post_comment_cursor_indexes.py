@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0026_post_like_count_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_date', '-id'], name='theses_comm_post_id_7d8dfe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_date', '-id'], name='theses_post_created_a732d2_idx'),
+        ),
+    ]
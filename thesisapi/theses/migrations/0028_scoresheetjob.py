@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0027_post_comment_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreSheetJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Đang chờ'), ('running', 'Đang xử lý'), ('done', 'Hoàn thành'), ('failed', 'Thất bại')], default='pending', max_length=10)),
+                ('file', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('thesis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='theses.thesis')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scoresheetjob',
+            constraint=models.UniqueConstraint(fields=('thesis', 'fingerprint'), name='unique_score_sheet_job'),
+        ),
+    ]
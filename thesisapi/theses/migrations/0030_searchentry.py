@@ -0,0 +1,86 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:38
+
+import unicodedata
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE theses_searchentry_fts USING fts5(content, kind UNINDEXED, "
+    "content='theses_searchentry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER theses_searchentry_ai AFTER INSERT ON theses_searchentry BEGIN "
+    "INSERT INTO theses_searchentry_fts(rowid, content, kind) VALUES (new.id, new.content, new.kind); END",
+    "CREATE TRIGGER theses_searchentry_ad AFTER DELETE ON theses_searchentry BEGIN "
+    "INSERT INTO theses_searchentry_fts(theses_searchentry_fts, rowid, content, kind) "
+    "VALUES ('delete', old.id, old.content, old.kind); END",
+    "CREATE TRIGGER theses_searchentry_au AFTER UPDATE ON theses_searchentry BEGIN "
+    "INSERT INTO theses_searchentry_fts(theses_searchentry_fts, rowid, content, kind) "
+    "VALUES ('delete', old.id, old.content, old.kind); "
+    "INSERT INTO theses_searchentry_fts(rowid, content, kind) VALUES (new.id, new.content, new.kind); END",
+]
+
+SQLITE_FTS_REVERSE = [
+    "DROP TRIGGER IF EXISTS theses_searchentry_ai",
+    "DROP TRIGGER IF EXISTS theses_searchentry_ad",
+    "DROP TRIGGER IF EXISTS theses_searchentry_au",
+    "DROP TABLE IF EXISTS theses_searchentry_fts",
+]
+
+# Parser ngram để tìm được các âm tiết tiếng Việt ngắn hơn innodb_ft_min_token_size
+MYSQL_FTS = ["ALTER TABLE theses_searchentry ADD FULLTEXT INDEX theses_searchentry_content_ft (content) WITH PARSER ngram"]
+
+MYSQL_FTS_REVERSE = ["ALTER TABLE theses_searchentry DROP INDEX theses_searchentry_content_ft"]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def fold(text):
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    return ' '.join(''.join(c for c in text if unicodedata.category(c) != 'Mn').lower().split())
+
+
+def fill_search_entries(apps, schema_editor):
+    SearchEntry = apps.get_model('theses', 'SearchEntry')
+    entries = [SearchEntry(kind='thesis', object_id=t.code, title=t.name, content=fold(f'{t.code} {t.name}'))
+               for t in apps.get_model('theses', 'Thesis').objects.all()]
+    for post in apps.get_model('theses', 'Post').objects.filter(active=True):
+        text = ' '.join(strip_tags(post.content).replace('&nbsp;', ' ').split())
+        entries.append(SearchEntry(kind='post', object_id=str(post.pk), title=text[:255], content=fold(text)))
+    for kind, model in [('lecturer', 'Lecturer'), ('student', 'Student')]:
+        entries += [SearchEntry(kind=kind, object_id=str(p.pk), title=p.full_name,
+                                content=fold(f'{p.code} {p.full_name}'))
+                    for p in apps.get_model('theses', model).objects.all()]
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0029_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('thesis', 'Khóa luận'), ('post', 'Bài đăng'), ('lecturer', 'Giảng viên'), ('student', 'Sinh viên')], max_length=10)),
+                ('object_id', models.CharField(max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(run_for_vendor({'sqlite': SQLITE_FTS, 'mysql': MYSQL_FTS}),
+                             run_for_vendor({'sqlite': SQLITE_FTS_REVERSE, 'mysql': MYSQL_FTS_REVERSE})),
+        migrations.RunPython(fill_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:40
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def fold(text):
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    return ' '.join(''.join(c for c in text if unicodedata.category(c) != 'Mn').lower().split())
+
+
+def fill_search_columns(apps, schema_editor):
+    for model, source, target in [('Ministry', 'full_name', 'full_name_search'),
+                                  ('Lecturer', 'full_name', 'full_name_search'),
+                                  ('Student', 'full_name', 'full_name_search'),
+                                  ('Major', 'name', 'name_search'),
+                                  ('Thesis', 'name', 'name_search')]:
+        Model = apps.get_model('theses', model)
+        rows = list(Model.objects.only(source))
+        for row in rows:
+            setattr(row, target, fold(getattr(row, source)))
+        Model.objects.bulk_update(rows, [target], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0030_searchentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecturer',
+            name='full_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='major',
+            name='name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='ministry',
+            name='full_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='full_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='thesis',
+            name='name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_search_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:50
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Làm tròn từng điểm tổng về 2 chữ số như theses.stats.contribution để khớp với cập nhật tăng dần
+def fill_thesis_stats(apps, schema_editor):
+    Thesis = apps.get_model('theses', 'Thesis')
+    ThesisStat = apps.get_model('theses', 'ThesisStat')
+
+    totals = {}
+    rows = Thesis.objects.values('school_year_id', 'major_id', 'major__faculty_id', 'total_score', 'result')
+    for item in rows.order_by().iterator(chunk_size=2000):
+        total = totals.setdefault((item['school_year_id'], item['major_id']), {
+            'faculty_id': item['major__faculty_id'], 'count': 0, 'pass_count': 0, 'score_count': 0,
+            'score_sum': Decimal('0'), 'score_sq_sum': Decimal('0')})
+        total['count'] += 1
+        total['pass_count'] += int(bool(item['result']))
+        if item['total_score'] is not None:
+            score = Decimal(str(item['total_score'])).quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
+            total['score_count'] += 1
+            total['score_sum'] += score
+            total['score_sq_sum'] += score * score
+
+    ThesisStat.objects.bulk_create([
+        ThesisStat(school_year_id=school_year_id, major_id=major_id, **total)
+        for (school_year_id, major_id), total in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theses', '0031_search_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThesisStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('pass_count', models.IntegerField(default=0)),
+                ('score_count', models.IntegerField(default=0)),
+                ('score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('score_sq_sum', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='theses.faculty')),
+                ('major', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='theses.major')),
+                ('school_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='theses.schoolyear')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='thesisstat',
+            constraint=models.UniqueConstraint(fields=('school_year', 'major'), name='unique_thesis_stat'),
+        ),
+        migrations.RunPython(fill_thesis_stats, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Length
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from ckeditor.fields import RichTextField
 from cloudinary.models import CloudinaryField
+from theses import registry
+from theses.text import fold
+
+
+# Gán cột tìm kiếm (bỏ dấu, chữ thường) từ cột gốc trước khi lưu, kể cả khi save(update_fields=...)
+def set_search_field(instance, source, target, kwargs):
+    setattr(instance, target, fold(getattr(instance, source)))
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and source in update_fields:
+        kwargs['update_fields'] = {*update_fields, target}
 
 
 class BaseModel(models.Model):
@@ -16,12 +28,17 @@ class BaseModel(models.Model):
 class UserBaseModel(models.Model):
     code = models.CharField(max_length=10, unique=True)
     full_name = models.CharField(max_length=50, null=False)
+    full_name_search = models.CharField(max_length=50, db_index=True, editable=False, default='')  # Đã bỏ dấu
     birthday = models.DateField(null=False)
     address = models.CharField(max_length=100, null=False)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        set_search_field(self, 'full_name', 'full_name_search', kwargs)
+        super().save(*args, **kwargs)
+
 
 class Role(models.Model):  # Vai trò (Quản trị viên, Giáo vụ, Giảng viên, Sinh viên)
     code = models.CharField(max_length=10, primary_key=True)
@@ -42,11 +59,11 @@ class User(AbstractUser):  # Người dùng
     role = models.ForeignKey(Role, on_delete=models.PROTECT)
 
     def has_role(self, required_role):
-        return self.role == required_role
+        return self.role_id == getattr(required_role, 'pk', required_role)
 
     def save(self, *args, **kwargs):
         if not self.pk and self.is_superuser:
-            self.role = Role.objects.get(code='admin')
+            self.role_id = 'admin'
         super().save(*args, **kwargs)
 
         # if not self.avatar:
@@ -88,11 +105,16 @@ class Faculty(models.Model):  # Khoa
 class Major(models.Model):  # Ngành
     code = models.CharField(max_length=10, primary_key=True)
     name = models.CharField(max_length=50, null=False)
+    name_search = models.CharField(max_length=50, db_index=True, editable=False, default='')  # Đã bỏ dấu
     faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        set_search_field(self, 'name', 'name_search', kwargs)
+        super().save(*args, **kwargs)
+
 
 class Lecturer(UserBaseModel):  # Giảng viên
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
@@ -117,9 +139,27 @@ class CouncilDetail(models.Model):  # Chi tiết hội đồng
     position = models.ForeignKey(Position, on_delete=models.PROTECT)
 
 
+class ThesisQuerySet(models.QuerySet):
+    # Không tải nội dung báo cáo (RichText), chỉ lấy độ dài để biết đã nộp hay chưa
+    def without_report(self):
+        return self.defer('report_file').annotate(report_size=Length('report_file'))
+
+    # Nạp sẵn mọi quan hệ ThesisSerializer cần: sinh viên, giảng viên hướng dẫn, phản biện của hội đồng
+    # (tên ngành, năm học, khoa lấy từ registry nên không cần join)
+    def with_related(self):
+        return self.select_related('council').prefetch_related(
+            'student_set',
+            'lecturers',
+            models.Prefetch('council__councildetail_set', to_attr='reviewer_details',
+                            queryset=CouncilDetail.objects.filter(position_id=registry.position_id(registry.REVIEWER))
+                            .select_related('lecturer').order_by('id'))
+        )
+
+
 class Thesis(models.Model):  # Khóa luận
     code = models.CharField(max_length=10, null=False, primary_key=True)
     name = models.CharField(max_length=200, null=False)
+    name_search = models.CharField(max_length=200, db_index=True, editable=False, default='')  # Đã bỏ dấu
     start_date = models.DateField()
     end_date = models.DateField()
     report_file = RichTextField(null=True, blank=True)
@@ -130,9 +170,17 @@ class Thesis(models.Model):  # Khóa luận
     council = models.ForeignKey(Council, on_delete=models.PROTECT, null=True, blank=True)
     lecturers = models.ManyToManyField(Lecturer, null=True, blank=True)  # Giảng viên hướng dẫn khóa luận (Tối đa 2)
 
+    objects = ThesisQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    # Đọc dòng cũ (khóa lại), ghi khóa luận và cập nhật bảng thống kê (theses.signals) trong cùng một transaction
+    def save(self, *args, **kwargs):
+        set_search_field(self, 'name', 'name_search', kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Student(UserBaseModel):  # Sinh viên
     gpa = models.FloatField()
@@ -144,6 +192,44 @@ class Student(UserBaseModel):  # Sinh viên
         return self.full_name
 
 
+class ThesisStat(models.Model):  # Thống kê khóa luận theo năm học, ngành (cập nhật dần bởi theses.stats)
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE)
+    major = models.ForeignKey(Major, on_delete=models.CASCADE)
+    faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)  # Khoa của ngành, để nhóm theo khoa không cần join
+    count = models.IntegerField(default=0)
+    pass_count = models.IntegerField(default=0)
+    score_count = models.IntegerField(default=0)  # Số khóa luận có điểm (total_score khác NULL)
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    score_sq_sum = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['school_year', 'major'], name='unique_thesis_stat')]
+
+
+class ScoreSheetJob(models.Model):  # Yêu cầu xuất phiếu chấm điểm PDF
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    Status_choice = [
+        (PENDING, 'Đang chờ'),
+        (RUNNING, 'Đang xử lý'),
+        (DONE, 'Hoàn thành'),
+        (FAILED, 'Thất bại')
+    ]
+
+    thesis = models.ForeignKey(Thesis, on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=64)  # Mã băm dữ liệu in trên phiếu (điểm, thành viên, sinh viên)
+    status = models.CharField(max_length=10, choices=Status_choice, default=PENDING)
+    file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['thesis', 'fingerprint'], name='unique_score_sheet_job')]
+
+
 class Criteria(models.Model):  # Tiêu chí (Ví dụ: Kiến thức chuyên môn, phương pháp nghiên cứu, kỹ năng trình bày)
     name = models.CharField(max_length=150, null=False)
     evaluation_method = models.CharField(max_length=255, null=True)  # Phương pháp đánh giá
@@ -167,6 +253,11 @@ class Score(models.Model):  # Điểm cho tiêu chí
 class Post(BaseModel):  # Bài đăng
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = RichTextField()
+    like_count = models.PositiveIntegerField(default=0)  # Số lượt thích (đang active)
+    comment_count = models.PositiveIntegerField(default=0)  # Số bình luận
+
+    class Meta:
+        indexes = [models.Index(fields=['-created_date', '-id'])]  # Phục vụ phân trang theo con trỏ
 
 
 class Interaction(BaseModel):
@@ -183,3 +274,56 @@ class Like(Interaction):  # Thích
 
 class Comment(Interaction):  # Bình luận
     content = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [models.Index(fields=['post', '-created_date', '-id'])]
+
+
+class OutboundEmail(models.Model):  # Email chờ gửi (outbox), được worker gửi theo lô
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    Status_choice = [
+        (PENDING, 'Chờ gửi'),
+        (SENT, 'Đã gửi'),
+        (FAILED, 'Thất bại')
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField()  # Danh sách email người nhận, cách nhau bởi dấu phẩy
+    status = models.CharField(max_length=10, choices=Status_choice, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_date = models.DateTimeField(default=timezone.now)
+    created_date = models.DateTimeField(auto_now_add=True)
+    sent_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_date'])]
+
+    def __str__(self):
+        return self.subject
+
+
+class SearchEntry(models.Model):  # Chỉ mục tìm kiếm chung cho khóa luận, bài đăng, giảng viên, sinh viên
+    THESIS = 'thesis'
+    POST = 'post'
+    LECTURER = 'lecturer'
+    STUDENT = 'student'
+    Kind_choice = [
+        (THESIS, 'Khóa luận'),
+        (POST, 'Bài đăng'),
+        (LECTURER, 'Giảng viên'),
+        (STUDENT, 'Sinh viên')
+    ]
+
+    kind = models.CharField(max_length=10, choices=Kind_choice)
+    object_id = models.CharField(max_length=20)
+    title = models.CharField(max_length=255)  # Nội dung hiển thị trong kết quả
+    content = models.TextField()  # Nội dung đã bỏ dấu, chữ thường (FULLTEXT trên MySQL, FTS5 trên SQLite)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry')]
@@ -0,0 +1,110 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from theses.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def default_from_email():
+    return 'Thesis Management <{}>'.format(settings.DEFAULT_FROM_EMAIL)
+
+
+# Đưa nhiều email vào outbox bằng một câu INSERT; messages là danh sách (subject, body, [email người nhận])
+def queue_emails(messages):
+    emails = OutboundEmail.objects.bulk_create([
+        OutboundEmail(subject=subject, body=body, from_email=default_from_email(), to=','.join(to))
+        for subject, body, to in messages
+    ])
+    if emails and getattr(settings, 'EMAIL_OUTBOX_AUTO_SEND', True):
+        transaction.on_commit(kick)
+    return emails
+
+
+def queue_email(subject, body, to):
+    return queue_emails([(subject, body, to)])
+
+
+# Ghi nhận một lần gửi lỗi: thử lại với thời gian chờ tăng dần, quá số lần tối đa thì đánh dấu thất bại
+def _mark_failed(email, error, max_attempts, retry_delay):
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = OutboundEmail.FAILED
+    else:
+        email.next_attempt_date = timezone.now() + timedelta(seconds=retry_delay * 2 ** (email.attempts - 1))
+
+
+# Gửi các email đến hạn qua một kết nối SMTP duy nhất; email lỗi được thử lại với thời gian chờ tăng dần.
+# Các dòng được nhận (claim) trong một transaction ngắn bằng cách dời next_attempt_date, việc gửi SMTP diễn ra
+# sau khi đã nhả khóa dòng. Worker chết giữa chừng thì email đến hạn lại sau EMAIL_OUTBOX_CLAIM_TIMEOUT giây.
+def send_pending(batch_size=50):
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    retry_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)  # Giây, nhân đôi sau mỗi lần lỗi
+    sent = 0
+
+    with transaction.atomic():
+        emails = list(OutboundEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status=OutboundEmail.PENDING, next_attempt_date__lte=timezone.now())
+                      .order_by('next_attempt_date', 'id')[:batch_size])
+        if not emails:
+            return 0
+        claimed_until = timezone.now() + timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 600))
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_date=claimed_until)
+
+    for email in emails:
+        email.attempts += 1
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:  # Không kết nối được SMTP: tính là một lần lỗi cho mọi email đã nhận
+        for email in emails:
+            _mark_failed(email, e, max_attempts, retry_delay)
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, email.from_email, to=email.to.split(','),
+                                       connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    _mark_failed(email, e, max_attempts, retry_delay)
+                else:
+                    email.status = OutboundEmail.SENT
+                    email.sent_date = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutboundEmail.objects.bulk_update(emails, ['status', 'attempts', 'last_error', 'next_attempt_date',
+                                               'sent_date'])
+    return sent
+
+
+def _send_in_background():
+    try:
+        while send_pending():
+            pass
+    except Exception:
+        logger.exception('Sending queued emails failed')  # Lỗi trong thread nền sẽ bị bỏ qua nếu không ghi log
+    finally:
+        close_old_connections()
+
+
+# Gửi ngay trong thread nền (không chặn request); lệnh send_outbox vẫn xử lý các email thử lại
+def kick():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox')
+    _executor.submit(_send_in_background)
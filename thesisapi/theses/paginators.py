@@ -9,5 +9,11 @@ class ThesisPaginator(pagination.PageNumberPagination):
     page_size = 5
 
 
-class PostCommentPaginator(pagination.PageNumberPagination):
+# Phân trang theo con trỏ (keyset) trên (-created_date, -id): không COUNT(*), không OFFSET
+class PostCommentPaginator(pagination.CursorPagination):
     page_size = 6
+    ordering = ('-created_date', '-id')
+
+
+class CommentPaginator(PostCommentPaginator):
+    page_size = 5
@@ -9,35 +9,38 @@ class IsAuthenticated(BasePermission):
         return request.user.is_authenticated
 
 
+# role_id chính là mã vai trò (Role.code là khóa chính) nên không cần truy vấn bảng Role
 class IsMinistry(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role.code == 'ministry'
+        return request.user.is_authenticated and request.user.role_id == 'ministry'
 
 
 class IsLecturer(BasePermission):
     def has_permission(self, request, view):
         if request.user.is_anonymous:
             return False
-        return request.user.is_authenticated and request.user.role.code == 'lecturer'
+        return request.user.is_authenticated and request.user.role_id == 'lecturer'
 
 
 class IsStudent(BasePermission):
     def has_permission(self, request, view):
         if request.user.is_anonymous:
             return False
-        return request.user.is_authenticated and request.user.role.code == 'student'
+        return request.user.is_authenticated and request.user.role_id == 'student'
 
 
+# So sánh theo id để không phải nạp user của đối tượng
 class CommentOwner(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, comment):
-        return super().has_permission(request, view) and request.user == comment.user
+        return super().has_permission(request, view) and comment.user_id == request.user.pk
 
 
 class PostOwner(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, post):
-        return super().has_permission(request, view) and request.user == post.user
+        return super().has_permission(request, view) and post.user_id == request.user.pk
 
 
+# Khóa chính của Lecturer là user_id; queryset nên select_related('council_detail')
 class ScoreOwner(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, score):
-        return super().has_permission(request, view) and request.user == score.council_detail.lecturer.user
\ No newline at end of file
+        return super().has_permission(request, view) and score.council_detail.lecturer_id == request.user.pk
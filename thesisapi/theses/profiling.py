@@ -0,0 +1,152 @@
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import ListSerializer, Serializer
+
+_lock = threading.Lock()
+_stats = {}
+_local = threading.local()  # Số liệu của request đang xử lý trên thread hiện tại (request.profiling)
+
+
+# Cộng dồn số liệu của một request vào thống kê theo view action
+def record(action, queries, db_time, serialize_time, render_time, total_time):
+    with _lock:
+        item = _stats.setdefault(action, {'requests': 0, 'queries': 0, 'db_time': 0.0, 'serialize_time': 0.0,
+                                          'render_time': 0.0, 'total_time': 0.0, 'max_time': 0.0})
+        item['requests'] += 1
+        item['queries'] += queries
+        item['db_time'] += db_time
+        item['serialize_time'] += serialize_time
+        item['render_time'] += render_time
+        item['total_time'] += total_time
+        item['max_time'] = max(item['max_time'], total_time)
+
+
+# Số liệu trung bình theo từng action (thời gian tính bằng ms), action chậm nhất đứng đầu
+def snapshot():
+    with _lock:
+        items = [(action, dict(item)) for action, item in _stats.items()]
+
+    result = []
+    for action, item in items:
+        requests = item['requests']
+        result.append({
+            'action': action,
+            'requests': requests,
+            'avg_queries': round(item['queries'] / requests, 2),
+            'avg_db_ms': round(item['db_time'] * 1000 / requests, 2),
+            'avg_serialize_ms': round(item['serialize_time'] * 1000 / requests, 2),
+            'avg_render_ms': round(item['render_time'] * 1000 / requests, 2),
+            'avg_total_ms': round(item['total_time'] * 1000 / requests, 2),
+            'max_total_ms': round(item['max_time'] * 1000, 2),
+        })
+
+    return sorted(result, key=lambda item: item['avg_total_ms'], reverse=True)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+# Đếm số truy vấn và thời gian DB thông qua connection.execute_wrapper
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+# Bọc property data của Serializer/ListSerializer để đo thời gian serialize (to_representation, gồm cả các
+# truy vấn phát sinh khi serialize). Chỉ tính serializer ngoài cùng, serializer lồng bên trong không cộng lại.
+def _timed(data):
+    def timed_data(self):
+        profile = getattr(_local, 'profile', None)
+        if profile is None or profile['serializing']:
+            return data.fget(self)
+
+        profile['serializing'] = True
+        start = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            profile['serialize_time'] += time.perf_counter() - start
+            profile['serializing'] = False
+
+    timed_data.profiled = True
+    return property(timed_data)
+
+
+def instrument_serializers():
+    for serializer_class in [Serializer, ListSerializer]:
+        if not getattr(serializer_class.data.fget, 'profiled', False):
+            serializer_class.data = _timed(serializer_class.data)
+
+
+def action_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+
+
+# Đo số truy vấn, thời gian DB, thời gian serialize, thời gian render và tổng thời gian của mỗi request.
+# Bật bằng PROFILING_ENABLED = True; khi tắt middleware bị loại khỏi chuỗi xử lý (không tốn chi phí).
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request.profiling = {'action': None, 'serialize_time': 0.0, 'serializing': False, 'render_time': 0.0}
+        _local.profile = request.profiling
+        start = time.perf_counter()
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+
+        total_time = time.perf_counter() - start
+        serialize_time = request.profiling['serialize_time']
+        render_time = request.profiling['render_time']
+        action = request.profiling['action']
+        if action:
+            record(action, timer.count, timer.duration, serialize_time, render_time, total_time)
+
+        response['Server-Timing'] = (f'db;dur={timer.duration * 1000:.2f};desc="{timer.count} queries", '
+                                     f'serialize;dur={serialize_time * 1000:.2f}, '
+                                     f'render;dur={render_time * 1000:.2f}, total;dur={total_time * 1000:.2f}')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profiling['action'] = action_name(request, view_func)
+
+    # Thời gian render (chuyển dữ liệu đã serialize sang JSON) của Response DRF
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.profiling['render_time'] = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,95 @@
+import threading
+
+from django.apps import apps
+from django.core.signals import request_finished, request_started
+from theses import caching
+
+# Tên các vị trí trong hội đồng (bảng Position)
+CHAIRMAN = 'Chủ tịch'
+SECRETARY = 'Thư ký'
+REVIEWER = 'Phản biện'
+
+MODELS = ['Position', 'Faculty', 'Major', 'SchoolYear']
+
+
+# Ánh xạ mã/tên -> id (và ngược lại) của các bảng danh mục nhỏ, giữ trong bộ nhớ của process.
+# Nạp lại khi phiên bản của các model (caching.model_versions, đổi bởi signal sau khi commit) thay đổi,
+# kể cả khi thay đổi đến từ process khác (cache dùng chung, xem CACHES). Trong một request chỉ hỏi phiên bản
+# ở lần tra cứu đầu tiên, các lần sau (mỗi dòng của serializer) dùng lại registry đã kiểm tra.
+class Registry:
+    def __init__(self, versions):
+        self.versions = versions
+
+        Position, Faculty, Major, SchoolYear = [apps.get_model('theses', name) for name in MODELS]
+        self.position_names = dict(Position.objects.values_list('id', 'name'))
+        self.position_ids = {name: pk for pk, name in self.position_names.items()}
+        self.faculty_names = dict(Faculty.objects.values_list('code', 'name'))
+        self.major_names = dict(Major.objects.values_list('code', 'name'))
+        self.school_year_names = dict(SchoolYear.objects.values_list('id', 'name'))
+
+
+_registry = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _request_started(**kwargs):
+    _local.in_request = True
+    _local.registry = None
+
+
+def _request_finished(**kwargs):
+    _local.in_request = False
+    _local.registry = None
+
+
+request_started.connect(_request_started)
+request_finished.connect(_request_finished)
+
+
+def get():
+    global _registry
+    in_request = getattr(_local, 'in_request', False)
+    if in_request and _local.registry is not None:
+        return _local.registry
+
+    versions = caching.model_versions([apps.get_model('theses', name) for name in MODELS])
+    registry = _registry
+    if registry is None or registry.versions != versions:
+        with _lock:
+            if _registry is None or _registry.versions != versions:
+                _registry = Registry(versions)
+            registry = _registry
+    if in_request:
+        _local.registry = registry
+    return registry
+
+
+def reset():
+    global _registry
+    with _lock:
+        _registry = None
+    _local.registry = None
+
+
+def position_id(name):
+    return get().position_ids.get(name)
+
+
+def position_name(pk):
+    try:
+        return get().position_names.get(int(pk))
+    except (TypeError, ValueError):
+        return None
+
+
+def faculty_name(code):
+    return get().faculty_names.get(code)
+
+
+def major_name(code):
+    return get().major_names.get(code)
+
+
+def school_year_name(pk):
+    return get().school_year_names.get(pk)
@@ -0,0 +1,126 @@
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+# Module này không import model Django để process pool (kể cả kiểu spawn) dùng được
+
+FONT_NAME = 'Tahoma'
+FONT_PATH = os.path.join(os.path.dirname(__file__), 'static/fonts/tahoma.ttf')
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 50
+
+SCORE_TABLE_COL_WIDTHS = [PAGE_WIDTH * 0.4, PAGE_WIDTH * 0.2, PAGE_WIDTH * 0.2]
+SCORE_TABLE_ROW_HEIGHT = 20
+SCORE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, -1), FONT_NAME),  # Đặt font Tahoma cho toàn bộ bảng
+    ('FONTSIZE', (0, 0), (-1, -1), 12),  # Đặt kích thước font
+    ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+    ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+])
+
+
+# Đăng ký font một lần cho cả process (gọi trong ThesesConfig.ready); force=True để đọc lại file TTF
+def register_fonts(force=False):
+    if force or FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+        static_layout.cache_clear()
+
+
+def string_width(text, size=12):
+    return pdfmetrics.stringWidth(text, FONT_NAME, size)
+
+
+# Vị trí các dòng chữ cố định (tiêu đề, chữ ký) chỉ tính một lần
+@lru_cache(maxsize=None)
+def static_layout():
+    date_string = "TP. Hồ Chí Minh, Ngày......Tháng......Năm......"
+    signature_string = "Chữ ký lãnh đạo (Ký và ghi rõ họ tên)"
+    start_x = A4[0] - max(string_width(date_string), string_width(signature_string)) - MARGIN
+
+    header = [
+        ((350 - string_width("BỘ GIÁO DỤC VÀ ĐẠO TẠO")) / 2, 800, "BỘ GIÁO DỤC VÀ ĐẠO TẠO"),
+        ((350 - string_width("TRƯỜNG ĐẠI HỌC MỞ TP. HỒ CHÍ MINH")) / 2, 780, "TRƯỜNG ĐẠI HỌC MỞ TP. HỒ CHÍ MINH"),
+        (500 - string_width("PHIẾU CHẤM ĐIỂM"), 800, "PHIẾU CHẤM ĐIỂM"),
+    ]
+    footer = [
+        (start_x, MARGIN + 180, date_string),
+        (start_x + 15, MARGIN + 160, signature_string),
+    ]
+    return header, footer
+
+
+def draw_lines(pdf, lines):
+    for x, y, text in lines:
+        pdf.drawString(x, y, text)
+
+
+# Render phiếu chấm điểm từ dữ liệu của reports.score_sheet_data, trả về nội dung file PDF
+def render_score_sheet(data):
+    register_fonts()
+    header, footer = static_layout()
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+
+    pdf.setFont(FONT_NAME, 12)
+    draw_lines(pdf, header)
+
+    pdf.setFont(FONT_NAME, 14)
+
+    thesis_title = f"ĐỀ TÀI: {data['name']}"
+    pdf.drawString((PAGE_WIDTH - string_width(thesis_title)) / 2 - 35, PAGE_HEIGHT - 50, thesis_title)
+
+    pdf.drawString(50, PAGE_HEIGHT - 100, f"Ngành: {data['major']}")
+
+    pdf.drawString(50, PAGE_HEIGHT - 130, "Danh sách sinh viên thực hiện:")
+    student_start_y = PAGE_HEIGHT - 160
+    for code, full_name, major_name in data['students']:
+        pdf.drawString(60, student_start_y, f"Mã SV: {code}")
+        pdf.drawString(170, student_start_y, f"Tên: {full_name}")
+        pdf.drawString(340, student_start_y, f"Ngành: {major_name}")
+        student_start_y -= 30
+
+    pdf.drawString(50, PAGE_HEIGHT - 250, "Danh sách giảng viên hướng dẫn:")
+    counselor_start_y = PAGE_HEIGHT - 280
+    for code, full_name in data['instructors']:
+        pdf.drawString(60, counselor_start_y, f"Mã GV: {code}")
+        pdf.drawString(170, counselor_start_y, f"Tên: {full_name}")
+        counselor_start_y -= 30
+
+    pdf.drawString(50, PAGE_HEIGHT - 370, f"Hội đồng chấm khóa luận: {data['council']}")
+
+    # Vẽ bảng điểm
+    pdf.setFont(FONT_NAME, 12)
+    table_data = [['TÊN GIẢNG VIÊN', 'CHỨC VỤ', 'ĐIỂM']]
+    for lecturer, position, score in data['lecturers']:
+        table_data.append([lecturer, position, f"{score}"])
+    table_data.append(['', 'TỔNG ĐIỂM', f"{data['total_score']}"])
+
+    table = Table(table_data, colWidths=SCORE_TABLE_COL_WIDTHS, rowHeights=SCORE_TABLE_ROW_HEIGHT)
+    table.setStyle(SCORE_TABLE_STYLE)
+    table.wrapOn(pdf, sum(SCORE_TABLE_COL_WIDTHS), 400)
+    table.drawOn(pdf, 50, PAGE_HEIGHT - 500)
+
+    pdf.setFont(FONT_NAME, 12)
+    draw_lines(pdf, footer)
+
+    pdf.save()
+
+    pdf_data = buffer.getvalue()
+    buffer.close()
+
+    if not pdf_data.startswith(b'%PDF'):
+        raise ValueError('Xuất file PDF thất bại!')
+
+    return pdf_data
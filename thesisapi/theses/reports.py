@@ -0,0 +1,192 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from theses.models import ScoreSheetJob
+from theses.rendering import render_score_sheet
+from theses.scoring import lecturer_score_rows
+
+_executor = None
+_process_pool = None
+_executor_lock = threading.Lock()
+
+
+# Dữ liệu in trên phiếu chấm điểm (chỉ gồm kiểu cơ bản để băm và truyền sang worker)
+def score_sheet_data(thesis):
+    return {
+        'code': thesis.code,
+        'name': thesis.name,
+        'major': thesis.major.name,
+        'council': thesis.council.name if thesis.council else '',
+        'total_score': thesis.total_score,
+        'students': [[student.code, student.full_name, student.major.name]
+                     for student in thesis.student_set.select_related('major').order_by('code')],
+        'instructors': [[lecturer.code, lecturer.full_name] for lecturer in thesis.lecturers.order_by('code')],
+        'lecturers': [[row['lecturer'], row['position'] or '', row['score']]
+                      for row in lecturer_score_rows(thesis.code)],
+    }
+
+
+# Phiếu chấm chỉ cần tạo lại khi dữ liệu in trên phiếu thay đổi
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+# Render phiếu chấm của một job, lưu file và cập nhật trạng thái
+def run_job(job_id, data):
+    # update() không tự cập nhật auto_now: ghi updated_date để phát hiện job bị treo
+    ScoreSheetJob.objects.filter(pk=job_id).update(status=ScoreSheetJob.RUNNING, updated_date=timezone.now())
+    try:
+        pdf_data = render_score_sheet(data)
+        filename = f"score_{data['code']}_{fingerprint(data)[:12]}.pdf"
+        file_path = default_storage.save(os.path.join('media', filename), ContentFile(pdf_data))
+    except Exception as e:
+        ScoreSheetJob.objects.filter(pk=job_id).update(status=ScoreSheetJob.FAILED, error=str(e),
+                                                       updated_date=timezone.now())
+        return
+
+    ScoreSheetJob.objects.filter(pk=job_id).update(status=ScoreSheetJob.DONE, file=file_path, error='',
+                                                   updated_date=timezone.now())
+
+    # Xóa các phiếu cũ của khóa luận (dữ liệu đã thay đổi nên không còn dùng)
+    old_jobs = (ScoreSheetJob.objects.filter(thesis_id=data['code'])
+                .exclude(pk=job_id).exclude(status__in=[ScoreSheetJob.PENDING, ScoreSheetJob.RUNNING]))
+    for old_job in old_jobs:
+        if old_job.file:
+            default_storage.delete(old_job.file)
+        old_job.delete()
+
+
+# Chạy trong thread của worker pool: đóng kết nối DB của thread sau mỗi job
+def run_job_in_worker(job_id, data):
+    try:
+        run_job(job_id, data)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SCORE_SHEET_WORKERS', 2),
+                                           thread_name_prefix='score-sheet')
+    return _executor
+
+
+# Đưa job vào hàng đợi render sau khi transaction commit ('sync' thì render ngay, dùng khi test)
+def enqueue(job, data):
+    if getattr(settings, 'SCORE_SHEET_RENDER_MODE', 'async') == 'sync':
+        run_job(job.pk, data)
+    else:
+        transaction.on_commit(lambda: get_executor().submit(run_job_in_worker, job.pk, data))
+
+
+# Job đang chờ/đang xử lý quá SCORE_SHEET_JOB_TIMEOUT giây coi như bị mất (process khởi động lại, worker lỗi)
+def is_abandoned(job):
+    timeout = timedelta(seconds=getattr(settings, 'SCORE_SHEET_JOB_TIMEOUT', 300))
+    return job.status in [ScoreSheetJob.PENDING, ScoreSheetJob.RUNNING] and job.updated_date < timezone.now() - timeout
+
+
+# Trả về job của dữ liệu hiện tại, tạo và đưa vào hàng đợi nếu chưa có file hợp lệ
+def request_score_sheet(thesis):
+    data = score_sheet_data(thesis)
+    job, created = ScoreSheetJob.objects.get_or_create(thesis=thesis, fingerprint=fingerprint(data))
+
+    stale = job.status == ScoreSheetJob.FAILED or is_abandoned(job) or (job.status == ScoreSheetJob.DONE
+                                                                        and not default_storage.exists(job.file))
+    if stale:
+        # Điều kiện theo trạng thái đã đọc: nhiều request cùng lúc chỉ một request đưa lại vào hàng đợi
+        stale = ScoreSheetJob.objects.filter(pk=job.pk, status=job.status, updated_date=job.updated_date).update(
+            status=ScoreSheetJob.PENDING, file='', error='', updated_date=timezone.now()) > 0
+
+    if created or stale:
+        enqueue(job, data)
+        job.refresh_from_db()
+
+    return job
+
+
+def get_process_pool():
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=settings.SCORE_SHEET_PROCESSES)
+    return _process_pool
+
+
+# Bộ đệm ghi cho ZipFile không hỗ trợ seek: zipfile sẽ ghi data descriptor thay vì quay lại sửa header
+class _ZipStream(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# Lấy file PDF đã tạo (nếu dữ liệu không đổi), phần còn lại render song song trong process pool
+def _score_sheet_files(theses):
+    items = [(thesis.code, score_sheet_data(thesis)) for thesis in theses]
+    fingerprints = {code: fingerprint(data) for code, data in items}
+
+    cached = {job.thesis_id: job.file for job in
+              ScoreSheetJob.objects.filter(thesis_id__in=fingerprints.keys(), status=ScoreSheetJob.DONE,
+                                           fingerprint__in=fingerprints.values())
+              if job.fingerprint == fingerprints[job.thesis_id] and default_storage.exists(job.file)}
+
+    missing = [data for code, data in items if code not in cached]
+    if getattr(settings, 'SCORE_SHEET_PROCESSES', 0) > 0 and len(missing) > 1:
+        rendered = get_process_pool().map(render_score_sheet, missing)
+    else:
+        rendered = map(render_score_sheet, missing)
+    rendered = dict(zip([data['code'] for data in missing], rendered))
+
+    for code, data in items:
+        if code in cached:
+            with default_storage.open(cached[code], 'rb') as f:
+                yield code, f.read()
+        else:
+            yield code, rendered[code]
+
+
+# Nén phiếu chấm của nhiều khóa luận thành một file ZIP, trả về từng phần (dùng với StreamingHttpResponse).
+# Mỗi lượt chỉ xử lý một nhóm nhỏ khóa luận nên không giữ toàn bộ PDF trong bộ nhớ.
+def stream_score_sheets_zip(theses, chunk_size=None):
+    chunk_size = chunk_size or max(getattr(settings, 'SCORE_SHEET_PROCESSES', 0), 1) * 2
+    theses = list(theses.select_related('major', 'council').without_report())
+
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(0, len(theses), chunk_size):
+            for code, pdf_data in _score_sheet_files(theses[i:i + chunk_size]):
+                archive.writestr(f'score_{code}.pdf', pdf_data)
+                yield stream.pop()
+
+    yield stream.pop()
+
+
+# File ZIP phiếu chấm trả về dạng stream
+def score_sheets_response(theses, filename):
+    response = StreamingHttpResponse(stream_score_sheets_zip(theses), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,83 @@
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from theses import caching, stats
+from theses.models import Score, Thesis
+
+
+# Tổng điểm có trọng số của từng giảng viên (một truy vấn GROUP BY)
+def lecturer_total_scores(thesis_code):
+    rows = (Score.objects.filter(thesis_criteria__thesis_id=thesis_code)
+            .values('council_detail__lecturer_id')
+            .annotate(total=Sum(F('score_number') * F('thesis_criteria__weight')))
+            .order_by())
+
+    return {row['council_detail__lecturer_id']: Decimal(row['total']) for row in rows}
+
+
+# Bảng điểm theo giảng viên (tên, chức vụ, tổng điểm có trọng số) cho phiếu chấm điểm
+def lecturer_score_rows(thesis_code):
+    return list(Score.objects.filter(thesis_criteria__thesis_id=thesis_code)
+                .values('council_detail__lecturer_id')
+                .annotate(lecturer=F('council_detail__lecturer__full_name'),
+                          position=F('council_detail__position__name'),
+                          score=Sum(F('score_number') * F('thesis_criteria__weight')),
+                          first_detail=Min('council_detail_id'))
+                .order_by('first_detail')
+                .values('lecturer', 'position', 'score'))
+
+
+# Trung bình cộng tổng điểm của các giảng viên, làm tròn 2 chữ số
+def average_score(total_scores):
+    if not total_scores:
+        return Decimal('0.00')
+
+    average = sum(total_scores) / len(total_scores)
+    return average.quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
+
+
+# Tính lại điểm khóa luận: 1 truy vấn tổng hợp + 1 truy vấn UPDATE,
+# cùng bảng thống kê (đọc giá trị cũ trước, chỉ ghi khi điểm/kết quả thay đổi)
+def update_total_score(thesis_code):
+    total_scores = lecturer_total_scores(thesis_code)
+    overall_average_score = average_score(list(total_scores.values()))
+
+    with transaction.atomic():
+        old = stats.old_row(thesis_code, for_update=True)
+        if old is None:
+            return
+        new = dict(old, total_score=float(overall_average_score),  # Convert về float để lưu vào FloatField
+                   result=overall_average_score >= Decimal('5.00'))
+
+        Thesis.objects.filter(code=thesis_code).update(total_score=new['total_score'], result=new['result'])
+        stats.apply(old, new)
+    caching.invalidate(f'thesis:{thesis_code}')  # update() không phát signal post_save
+
+
+_pending = threading.local()
+
+
+def _pending_codes():
+    if not hasattr(_pending, 'codes'):
+        _pending.codes = set()
+    return _pending.codes
+
+
+def _recompute_pending(thesis_code):
+    codes = _pending_codes()
+    if thesis_code in codes:  # Các callback trùng mã khóa luận phía sau sẽ bỏ qua
+        codes.discard(thesis_code)
+        update_total_score(thesis_code)
+
+
+# Đánh dấu khóa luận cần tính lại điểm, chỉ tính một lần sau khi transaction commit
+def schedule_total_score(thesis_code):
+    if getattr(settings, 'SCORE_RECOMPUTE_MODE', 'deferred') == 'sync':
+        update_total_score(thesis_code)
+        return
+
+    _pending_codes().add(thesis_code)
+    transaction.on_commit(lambda: _recompute_pending(thesis_code))
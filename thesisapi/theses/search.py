@@ -0,0 +1,130 @@
+from django.db import connection
+from django.db.models import FloatField, IntegerField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from theses.models import SearchEntry, Thesis, Post, Lecturer, Student
+from theses.text import fold, terms, plain_text
+
+FTS_TABLE = 'theses_searchentry_fts'  # Bảng FTS5 (SQLite), tạo trong migration 0030
+
+
+def _thesis(thesis):
+    return thesis.code, thesis.name, f'{thesis.code} {thesis.name}'
+
+
+def _post(post):
+    text = plain_text(post.content)
+    return str(post.pk), text[:255], text
+
+
+def _person(person):
+    return str(person.pk), person.full_name, f'{person.code} {person.full_name}'
+
+
+# Loại đối tượng được đánh chỉ mục: model -> (kind, hàm trả về (object_id, title, nội dung tìm kiếm), các trường cần nạp)
+DOCUMENTS = {
+    Thesis: (SearchEntry.THESIS, _thesis, ['name']),
+    Post: (SearchEntry.POST, _post, ['content']),
+    Lecturer: (SearchEntry.LECTURER, _person, ['code', 'full_name']),
+    Student: (SearchEntry.STUDENT, _person, ['code', 'full_name']),
+}
+
+ACTIVE_ONLY = [Post]  # Bài đăng đã ẩn (active=False) không được tìm thấy
+
+
+def _searchable(instance):
+    return type(instance) not in ACTIVE_ONLY or instance.active
+
+
+def _entry(instance):
+    kind, document, fields = DOCUMENTS[type(instance)]
+    object_id, title, text = document(instance)
+    return SearchEntry(kind=kind, object_id=object_id, title=title, content=fold(text))
+
+
+# Cập nhật chỉ mục của một đối tượng (gọi từ signal post_save)
+def index(instance):
+    if not _searchable(instance):
+        remove(instance)
+        return
+
+    entry = _entry(instance)
+    SearchEntry.objects.update_or_create(kind=entry.kind, object_id=entry.object_id,
+                                         defaults={'title': entry.title, 'content': entry.content})
+
+
+def remove(instance):
+    kind, document, fields = DOCUMENTS[type(instance)]
+    SearchEntry.objects.filter(kind=kind, object_id=document(instance)[0]).delete()
+
+
+# Tạo lại toàn bộ chỉ mục (lệnh rebuild_search_index)
+def rebuild(batch_size=500):
+    SearchEntry.objects.all().delete()
+    total = 0
+    for model, (kind, document, fields) in DOCUMENTS.items():
+        batch = []
+        queryset = model.objects.filter(active=True) if model in ACTIVE_ONLY else model.objects.all()
+        for instance in queryset.only(*fields).order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(_entry(instance))
+            if len(batch) >= batch_size:
+                total += len(SearchEntry.objects.bulk_create(batch))
+                batch = []
+        total += len(SearchEntry.objects.bulk_create(batch))
+    return total
+
+
+def _fts5_available():
+    return FTS_TABLE in connection.introspection.table_names(include_views=True)
+
+
+# Các mục khớp với từ khóa, kèm điểm liên quan (rank) theo backend:
+# MySQL dùng FULLTEXT (parser ngram), SQLite dùng FTS5, backend khác so khớp chuỗi con (rank = 0).
+# Trả về None nếu từ khóa không có từ nào.
+def matching(q, kinds=None):
+    words = terms(q)
+    if not words:
+        return None
+
+    entries = SearchEntry.objects.all()
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+
+    if connection.vendor == 'mysql':
+        expression = ' '.join(f'+"{word}"' for word in words)
+        return (entries.annotate(rank=RawSQL('MATCH (content) AGAINST (%s IN BOOLEAN MODE)', [expression],
+                                             output_field=FloatField()))
+                .filter(rank__gt=0))
+
+    if connection.vendor == 'sqlite' and _fts5_available():
+        expression = ' '.join(f'"{word}"*' for word in words)
+        return (entries.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                                             [expression]))
+                .annotate(rank=RawSQL(f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                                      f'AND rowid = theses_searchentry.id', [expression],
+                                      output_field=FloatField())))
+
+    for word in words:
+        entries = entries.filter(content__contains=word)
+    return entries.annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+# Lọc queryset của một model được đánh chỉ mục theo từ khóa
+def filter_queryset(queryset, q):
+    kind = DOCUMENTS[queryset.model][0]
+    entries = matching(q, [kind])
+    if entries is None:
+        return queryset
+    if kind == SearchEntry.THESIS:
+        return queryset.filter(pk__in=entries.values('object_id'))
+    return queryset.filter(pk__in=entries.values(object_pk=Cast('object_id', IntegerField())))
+
+
+# Lọc theo cột đã bỏ dấu (full_name_search, name_search): q khớp chuỗi con, prefix khớp phần đầu.
+# istartswith sinh LIKE 'abc%' theo collation của cột nên MySQL quét khoảng trên chỉ mục B-tree.
+def filter_by_name(queryset, field, q=None, prefix=None):
+    if q:
+        queryset = queryset.filter(**{f'{field}__contains': fold(q)})
+    if prefix:
+        queryset = queryset.filter(**{f'{field}__istartswith': fold(prefix)})
+    return queryset
@@ -1,6 +1,9 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from theses import registry
 from theses.models import Student, Lecturer, Ministry, User, Position, SchoolYear, Faculty, Major, Council, \
-    CouncilDetail, Thesis, Score, Criteria, ThesisCriteria, Post, Comment
+    CouncilDetail, Thesis, Score, Criteria, ThesisCriteria, Post, Comment, ScoreSheetJob, SearchEntry
 
 
 # Người dùng
@@ -9,27 +12,28 @@ class UserSerializer(serializers.ModelSerializer):
     lecturer = serializers.SerializerMethodField()
     ministry = serializers.SerializerMethodField()
 
-    # Lấy thông tin của sinh viên, giảng viên, giáo vụ
-    def get_student(self, obj):
+    # Các quan hệ cần select_related trên queryset cha để không phát sinh truy vấn cho mỗi user
+    related_fields = ['role', 'student', 'lecturer', 'ministry']
+
+    @classmethod
+    def related(cls, prefix=''):
+        return [f'{prefix}{field}' for field in cls.related_fields]
+
+    # Lấy thông tin của sinh viên, giảng viên, giáo vụ (đọc từ quan hệ một-một đã nạp sẵn)
+    def get_profile(self, obj, name, serializer_class):
         try:
-            student = Student.objects.get(user=obj)
-            return StudentSerializer(student).data
-        except Student.DoesNotExist:
+            return serializer_class(getattr(obj, name)).data
+        except ObjectDoesNotExist:
             return None
 
+    def get_student(self, obj):
+        return self.get_profile(obj, 'student', StudentSerializer)
+
     def get_lecturer(self, obj):
-        try:
-            lecturer = Lecturer.objects.get(user=obj)
-            return LecturerSerializer(lecturer).data
-        except Lecturer.DoesNotExist:
-            return None
+        return self.get_profile(obj, 'lecturer', LecturerSerializer)
 
     def get_ministry(self, obj):
-        try:
-            ministry = Ministry.objects.get(user=obj)
-            return MinistrySerializer(ministry).data
-        except Ministry.DoesNotExist:
-            return None
+        return self.get_profile(obj, 'ministry', MinistrySerializer)
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
@@ -107,7 +111,7 @@ class MajorSerializer(serializers.ModelSerializer):
     # Trả về tên khoa khi GET
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['faculty'] = instance.faculty.name if instance.faculty else None
+        rep['faculty'] = registry.faculty_name(instance.faculty_id)
         return rep
 
 
@@ -120,7 +124,7 @@ class LecturerSerializer(serializers.ModelSerializer):
     # Trả về tên khoa khi GET
     def to_representation(self, instance): # to_representation được ghi đè để thay đổi cách hiển thị
         rep = super().to_representation(instance)
-        rep['faculty'] = instance.faculty.name if instance.faculty else None
+        rep['faculty'] = registry.faculty_name(instance.faculty_id)
         return rep
 
 
@@ -132,7 +136,7 @@ class StudentSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['major'] = instance.major.name if instance.major else None
+        rep['major'] = registry.major_name(instance.major_id)
         return rep
 
 
@@ -189,7 +193,11 @@ class ThesisSerializer(serializers.ModelSerializer):
 
     def get_reviewer(self, obj):
         if obj.council:
-            reviewer_detail = obj.council.councildetail_set.filter(position__name='Phản biện').first()
+            if hasattr(obj.council, 'reviewer_details'):  # Đã prefetch bởi Thesis.objects.with_related()
+                reviewer_detail = next(iter(obj.council.reviewer_details), None)
+            else:
+                reviewer_detail = (obj.council.councildetail_set
+                                   .filter(position_id=registry.position_id(registry.REVIEWER)).first())
             if reviewer_detail:
                 return LecturerSerializer(reviewer_detail.lecturer).data
         return None
@@ -204,12 +212,31 @@ class ThesisSerializer(serializers.ModelSerializer):
         rep = super().to_representation(instance)
 
         rep['council'] = instance.council.name if instance.council else None
-        rep['major'] = instance.major.name if instance.major else None
-        rep['school_year'] = instance.school_year.name if instance.school_year else None
+        rep['major'] = registry.major_name(instance.major_id)
+        rep['school_year'] = registry.school_year_name(instance.school_year_id)
 
         return rep
 
 
+# Khóa luận trong danh sách: không kèm nội dung báo cáo
+class ThesisListSerializer(ThesisSerializer):
+    has_report = serializers.SerializerMethodField()
+    report_size = serializers.SerializerMethodField()
+
+    def get_report_size(self, obj):
+        if hasattr(obj, 'report_size'):
+            return obj.report_size or 0
+        return len(obj.report_file or '')
+
+    def get_has_report(self, obj):
+        return self.get_report_size(obj) > 0
+
+    class Meta:
+        model = Thesis
+        fields = [field for field in ThesisSerializer.Meta.fields if field != 'report_file'] + \
+                 ['has_report', 'report_size']
+
+
 # Điểm
 class ScoreSerializer(serializers.ModelSerializer):
     class Meta:
@@ -217,6 +244,22 @@ class ScoreSerializer(serializers.ModelSerializer):
         fields = ['thesis_criteria', 'council_detail', 'score_number']
 
 
+# Yêu cầu xuất phiếu chấm điểm
+class ScoreSheetJobSerializer(serializers.ModelSerializer):
+    file_url = serializers.SerializerMethodField()
+
+    def get_file_url(self, obj):
+        if obj.status != ScoreSheetJob.DONE:
+            return None
+        request = self.context.get('request')
+        url = default_storage.url(obj.file)
+        return request.build_absolute_uri(url) if request else url
+
+    class Meta:
+        model = ScoreSheetJob
+        fields = ['id', 'thesis', 'status', 'file_url', 'error', 'created_date', 'updated_date']
+
+
 # Tiêu chí
 class CriteriaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -235,7 +278,7 @@ class ThesisCriteriaSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_scores(self, obj):
-        scores_queryset = Score.objects.filter(thesis_criteria=obj)
+        scores_queryset = obj.score_set.all()  # Dùng kết quả prefetch_related('score_set') nếu có
         serializer = ScoreSerializer(scores_queryset, many=True)
         return serializer.data
 
@@ -246,32 +289,23 @@ class ThesisCriteriaSerializer(serializers.ModelSerializer):
 
 # Bài đăng
 class PostSerializer(serializers.ModelSerializer):
-    like_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
     user = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = ['id', 'created_date', 'updated_date', 'content', 'user', 'like_count', 'comment_count']
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'like_count', 'comment_count']
 
     def get_user(self, obj):
-        user_id = obj.user_id
-        user = User.objects.get(pk=user_id)
-        user_serializer = UserSerializer(user)
-        return user_serializer.data
-
-    def get_like_count(self, obj):
-        return obj.like_set.filter(active=True).count()
-
-    def get_comment_count(self, obj):
-        return obj.comment_set.count()
+        return UserSerializer(obj.user).data
 
 
 class AuthenticatedPost(PostSerializer):
     liked = serializers.SerializerMethodField()
 
     def get_liked(self, post):
+        if hasattr(post, 'liked'):
+            return post.liked
         user = self.context['request'].user
         if user.is_authenticated:
             return post.like_set.filter(user=user, active=True).exists()
@@ -294,6 +328,17 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'content', 'created_date', 'user']
 
 
+# Kết quả tìm kiếm
+class SearchEntrySerializer(serializers.ModelSerializer):
+    type = serializers.CharField(source='kind')
+    id = serializers.CharField(source='object_id')
+    rank = serializers.FloatField()
+
+    class Meta:
+        model = SearchEntry
+        fields = ['type', 'id', 'title', 'rank']
+
+
 # Thống kê
 class ThesisStatsSerializer(serializers.Serializer):
     start_year = serializers.IntegerField()
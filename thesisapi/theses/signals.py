@@ -1,53 +1,183 @@
-from decimal import Decimal, ROUND_HALF_UP
-
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Score, Thesis, ThesisCriteria
+from oauth2_provider.models import AccessToken
+from .authentication import invalidate_token, invalidate_user
+from . import autocomplete, caching, search, stats
+from .models import Score, User, Thesis, Post, Lecturer, Student, Position, SchoolYear, Faculty, Major, Criteria, \
+    Council, CouncilDetail, ThesisCriteria, ThesisStat
+from .scoring import schedule_total_score
 
 
-def update_total_score(thesis_code):
-    try:
-        thesis = Thesis.objects.get(code=thesis_code)
-        thesis_criteria = ThesisCriteria.objects.filter(thesis=thesis)
+@receiver(post_save, sender=Score)
+def score_saved(sender, instance, **kwargs):
+    schedule_total_score(instance.thesis_criteria.thesis_id)
+    caching.invalidate(f'thesis:{instance.thesis_criteria.thesis_id}', stats.TAG)
 
-        if thesis_criteria.exists():
-            lecturer_total_scores = {}
 
-            # Tính tổng điểm có trọng số của từng giảng viên
-            for criteria in thesis_criteria:
-                scores = Score.objects.filter(thesis_criteria=criteria)
-                for score in scores:
-                    lecturer_id = score.council_detail.lecturer.pk
-                    weighted_score = score.score_number * criteria.weight
+@receiver(post_delete, sender=Score)
+def score_deleted(sender, instance, **kwargs):
+    schedule_total_score(instance.thesis_criteria.thesis_id)
+    caching.invalidate(f'thesis:{instance.thesis_criteria.thesis_id}', stats.TAG)
 
-                    if lecturer_id not in lecturer_total_scores:
-                        lecturer_total_scores[lecturer_id] = Decimal(weighted_score)
-                    else:
-                        lecturer_total_scores[lecturer_id] += Decimal(weighted_score)
 
-            total_scores = list(lecturer_total_scores.values())  # Danh sách các tổng điểm của từng giảng viên
+# Token bị thu hồi (revoke xóa AccessToken) hoặc được cập nhật thì bỏ khỏi cache xác thực
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def access_token_changed(sender, instance, **kwargs):
+    invalidate_token(instance.token)
 
-            # Tính trung bình cộng của tất cả các giảng viên
-            overall_average_score = sum(total_scores) / len(total_scores) if total_scores else Decimal('0.00')
-            overall_average_score = overall_average_score.quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
 
-            # Cập nhật vào khóa luận
-            thesis.total_score = float(overall_average_score)  # Convert về float để lưu vào FloatField
-            thesis.result = overall_average_score >= Decimal('5.00')
-            thesis.save()
-        else:
-            thesis.total_score = 0.00
-            thesis.result = False
-            thesis.save()
-    except Thesis.DoesNotExist:
-        print("Lỗi khi tính điểm")
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
 
 
-@receiver(post_save, sender=Score)
-def score_saved(sender, instance, **kwargs):
-    update_total_score(instance.thesis_criteria.thesis.code)
+# Giữ chỉ mục tìm kiếm đồng bộ với khóa luận, bài đăng, giảng viên, sinh viên
+@receiver(post_save, sender=Thesis)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Lecturer)
+@receiver(post_save, sender=Student)
+def searchable_saved(sender, instance, **kwargs):
+    search.index(instance)
 
 
-@receiver(post_delete, sender=Score)
-def score_deleted(sender, instance, **kwargs):
-    update_total_score(instance.thesis_criteria.thesis.code)
+@receiver(post_delete, sender=Thesis)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Lecturer)
+@receiver(post_delete, sender=Student)
+def searchable_deleted(sender, instance, **kwargs):
+    search.remove(instance)
+
+
+# Chỉ mục gợi ý trong bộ nhớ chỉ cập nhật sau khi transaction commit
+@receiver(post_save, sender=Lecturer)
+@receiver(post_save, sender=Student)
+def person_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.update(instance))
+
+
+@receiver(post_delete, sender=Lecturer)
+@receiver(post_delete, sender=Student)
+def person_deleted(sender, instance, **kwargs):
+    pk = instance.pk  # Django xóa pk của instance sau khi xóa xong
+    transaction.on_commit(lambda: autocomplete.remove(sender, pk))
+
+
+# Dữ liệu danh mục thay đổi: đổi phiên bản để ETag của các danh sách thay đổi theo
+@receiver(post_save, sender=Position)
+@receiver(post_save, sender=SchoolYear)
+@receiver(post_save, sender=Faculty)
+@receiver(post_save, sender=Major)
+@receiver(post_save, sender=Criteria)
+@receiver(post_delete, sender=Position)
+@receiver(post_delete, sender=SchoolYear)
+@receiver(post_delete, sender=Faculty)
+@receiver(post_delete, sender=Major)
+@receiver(post_delete, sender=Criteria)
+def reference_data_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: caching.bump(sender))
+    caching.invalidate(caching.model_tag(sender))
+
+
+# Tag của kết quả được cache (caching.cached): thesis:<mã>, council:<id>, lecturer:<id>.
+# Hội đồng và thành viên hội đồng hiển thị trong danh sách khóa luận của hội đồng (tên, phản biện).
+def council_tags(council_ids):
+    codes = Thesis.objects.filter(council_id__in=council_ids).values_list('code', flat=True)
+    return [f'council:{council_id}' for council_id in council_ids] + [f'thesis:{code}' for code in codes]
+
+
+@receiver(post_save, sender=Thesis)
+@receiver(post_delete, sender=Thesis)
+def thesis_changed(sender, instance, **kwargs):
+    caching.invalidate(f'thesis:{instance.pk}')
+
+
+@receiver(post_save, sender=ThesisCriteria)
+@receiver(post_delete, sender=ThesisCriteria)
+def thesis_criteria_changed(sender, instance, **kwargs):
+    caching.invalidate(f'thesis:{instance.thesis_id}', stats.TAG)  # Phân bố điểm theo tiêu chí
+
+
+# Sinh viên chuyển khóa luận: cần invalidate cả khóa luận cũ
+@receiver(pre_save, sender=Student)
+def student_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'thesis' in update_fields:
+        instance._old_thesis_id = Student.objects.filter(pk=instance.pk).values_list('thesis_id', flat=True).first()
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    codes = {instance.thesis_id, getattr(instance, '_old_thesis_id', None)} - {None}
+    caching.invalidate(*[f'thesis:{code}' for code in codes])
+
+
+@receiver(m2m_changed, sender=Thesis.lecturers.through)
+def thesis_lecturers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'pre_clear']:
+        return
+    if reverse:  # lecturer.thesis_set
+        lecturer_ids = [instance.pk]
+        codes = pk_set or instance.thesis_set.values_list('code', flat=True)
+    else:
+        codes = [instance.pk]
+        lecturer_ids = pk_set or instance.lecturers.values_list('pk', flat=True)
+    caching.invalidate(*[f'thesis:{code}' for code in codes],
+                       *[f'lecturer:{lecturer_id}' for lecturer_id in lecturer_ids])
+
+
+@receiver(post_save, sender=Council)
+@receiver(post_delete, sender=Council)
+def council_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'name' not in update_fields:
+        return  # Chỉ đổi trạng thái khóa: không ảnh hưởng dữ liệu được cache
+    caching.invalidate(*council_tags([instance.pk]))
+
+
+@receiver(post_save, sender=CouncilDetail)
+@receiver(post_delete, sender=CouncilDetail)
+def council_detail_changed(sender, instance, **kwargs):
+    caching.invalidate(*council_tags([instance.council_id]))
+
+
+# Họ tên giảng viên hiển thị trong thành viên hội đồng và các khóa luận giảng viên hướng dẫn, phản biện
+@receiver(post_save, sender=Lecturer)
+@receiver(post_delete, sender=Lecturer)
+def lecturer_changed(sender, instance, **kwargs):
+    council_ids = list(CouncilDetail.objects.filter(lecturer_id=instance.pk).values_list('council_id', flat=True))
+    codes = Thesis.lecturers.through.objects.filter(lecturer_id=instance.pk).values_list('thesis_id', flat=True)
+    caching.invalidate(f'lecturer:{instance.pk}', *council_tags(council_ids), *[f'thesis:{code}' for code in codes])
+
+
+# Bảng thống kê khóa luận: trừ phần đóng góp cũ, cộng phần mới trong cùng transaction với thay đổi
+@receiver(pre_save, sender=Thesis)
+def thesis_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'total_score', 'result', 'major', 'school_year'} & set(update_fields):
+        instance._old_stat_row = stats.old_row(instance.pk, for_update=True)  # Thesis.save chạy trong atomic
+
+
+@receiver(post_save, sender=Thesis)
+def thesis_stat_saved(sender, instance, **kwargs):
+    if hasattr(instance, '_old_stat_row'):
+        stats.apply(instance.__dict__.pop('_old_stat_row'), stats.row(instance))
+
+
+# Xóa: trừ giá trị đang lưu trong CSDL (không phải giá trị có thể đã cũ của instance), trong transaction của delete
+@receiver(pre_delete, sender=Thesis)
+def thesis_deleting(sender, instance, **kwargs):
+    instance._old_stat_row = stats.old_row(instance.pk, for_update=True)
+
+
+@receiver(post_delete, sender=Thesis)
+def thesis_stat_deleted(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_old_stat_row', None)
+    stats.apply(old, None)
+
+
+# Ngành chuyển khoa: cập nhật khoa trên các dòng thống kê của ngành
+@receiver(post_save, sender=Major)
+def major_stat_saved(sender, instance, **kwargs):
+    ThesisStat.objects.filter(major=instance).exclude(faculty_id=instance.faculty_id) \
+        .update(faculty_id=instance.faculty_id)
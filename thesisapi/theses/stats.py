@@ -0,0 +1,180 @@
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Max, Min, StdDev, Sum, Value
+from django.db.models.functions import Floor, Round
+from theses import caching, registry
+from theses.models import Major, Score, Thesis, ThesisStat
+
+FIELDS = ['school_year_id', 'major_id', 'total_score', 'result']  # Các trường của khóa luận ảnh hưởng thống kê
+COUNTERS = ['count', 'pass_count', 'score_count', 'score_sum', 'score_sq_sum']
+TAG = 'thesis_stats'  # Tag của các kết quả thống kê được cache (caching.cached), đổi khi điểm thay đổi
+MAX_SCORE = 10
+SCALE = 100  # Điểm có tối đa 2 chữ số thập phân
+PERCENTILES = [25, 50, 75, 90]
+
+
+def row(thesis):
+    return {field: getattr(thesis, field) for field in FIELDS}
+
+
+def old_row(thesis_code, for_update=False):
+    queryset = Thesis.objects.select_for_update() if for_update else Thesis.objects
+    return queryset.filter(code=thesis_code).values(*FIELDS).first()
+
+
+# Phần đóng góp của một khóa luận vào dòng thống kê (năm học, ngành) của nó
+def contribution(values):
+    score = values['total_score']
+    score = None if score is None else Decimal(str(score)).quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
+    return (values['school_year_id'], values['major_id']), {
+        'count': 1,
+        'pass_count': int(bool(values['result'])),
+        'score_count': int(score is not None),
+        'score_sum': score or Decimal('0'),
+        'score_sq_sum': score * score if score is not None else Decimal('0'),
+    }
+
+
+# Cộng phần chênh lệch vào dòng thống kê bằng F() để các cập nhật đồng thời không ghi đè lên nhau
+def _add(key, delta):
+    school_year_id, major_id = key
+    stats = ThesisStat.objects.filter(school_year_id=school_year_id, major_id=major_id)
+    changes = {field: F(field) + value for field, value in delta.items()}
+    if stats.update(**changes):
+        return
+
+    faculty_id = Major.objects.filter(code=major_id).values_list('faculty_id', flat=True).first()
+    try:
+        with transaction.atomic():
+            ThesisStat.objects.create(school_year_id=school_year_id, major_id=major_id, faculty_id=faculty_id,
+                                      **delta)
+    except IntegrityError:  # Process khác vừa tạo dòng này
+        stats.update(**changes)
+
+
+# Cập nhật thống kê khi một khóa luận đổi từ old sang new (dict theo FIELDS, None khi thêm mới hoặc xóa)
+def apply(old, new):
+    deltas = {}
+    for values, sign in [(old, -1), (new, 1)]:
+        if values is None:
+            continue
+        key, counters = contribution(values)
+        delta = deltas.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for field, value in counters.items():
+            delta[field] += sign * value
+
+    changed = [(key, delta) for key, delta in deltas.items() if any(delta.values())]
+    for key, delta in changed:
+        _add(key, delta)
+    if changed:
+        caching.invalidate(TAG)
+
+
+# Tính lại toàn bộ bảng thống kê từ bảng khóa luận (lệnh rebuild_thesis_stats). Cộng dồn phần đóng góp
+# (contribution) của từng khóa luận để làm tròn điểm giống hệt khi cập nhật tăng dần
+def rebuild():
+    totals, faculties = {}, {}
+    for values in Thesis.objects.values(*FIELDS, 'major__faculty_id').order_by().iterator(chunk_size=2000):
+        key, counters = contribution(values)
+        faculties[key] = values['major__faculty_id']
+        total = totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for field, value in counters.items():
+            total[field] += value
+
+    ThesisStat.objects.all().delete()
+    ThesisStat.objects.bulk_create([
+        ThesisStat(school_year_id=school_year_id, major_id=major_id, faculty_id=faculties[school_year_id, major_id],
+                   **total)
+        for (school_year_id, major_id), total in totals.items()
+    ], batch_size=500)
+    return len(totals)
+
+
+def average(score_sum, score_count):
+    if not score_count:
+        return None
+    return round(float(score_sum) / score_count, 2)
+
+
+# Số khóa luận, số đạt/không đạt, điểm trung bình theo năm học
+def by_school_year():
+    rows = (ThesisStat.objects.values('school_year_id', 'school_year__name', 'school_year__start_year',
+                                      'school_year__end_year')
+            .annotate(thesis_count=Sum('count'), thesis_pass_count=Sum('pass_count'),
+                      thesis_score_count=Sum('score_count'), thesis_score_sum=Sum('score_sum'))
+            .filter(thesis_count__gt=0)
+            .order_by('school_year__start_year', 'school_year_id'))
+
+    return [{
+        'school_year_id': item['school_year_id'],
+        'school_year__name': item['school_year__name'],
+        'start_year': item['school_year__start_year'].year,
+        'end_year': item['school_year__end_year'].year,
+        'thesis_count': item['thesis_count'],
+        'pass_count': item['thesis_pass_count'],
+        'fail_count': item['thesis_count'] - item['thesis_pass_count'],
+        'avg_score': average(item['thesis_score_sum'], item['thesis_score_count']),
+    } for item in rows]
+
+
+# Số khóa luận của từng ngành (kể cả ngành chưa có khóa luận), tên ngành lấy từ registry
+def count_by_major():
+    counts = dict(ThesisStat.objects.values_list('major_id').annotate(thesis_count=Sum('count')).order_by())
+    return [{'major_code': code, 'major_name': name, 'thesis_count': counts.get(code) or 0}
+            for code, name in registry.get().major_names.items()]
+
+
+# Giá trị ở phân vị percent (nội suy tuyến tính): chỉ đọc 1-2 dòng bằng ORDER BY ... LIMIT/OFFSET
+def percentile(values, count, percent):
+    position = (count - 1) * percent / 100
+    lower = math.floor(position)
+    rows = list(values[lower:lower + 2])
+    if len(rows) == 1 or position == lower:
+        return rows[0]
+    return rows[0] + (rows[1] - rows[0]) * (position - lower)
+
+
+# Phân bố điểm tổng của khóa luận, hoặc điểm của một tiêu chí (criteria_id), theo năm học và ngành.
+# Histogram (GROUP BY FLOOR(điểm / bucket_size)), trung bình, độ lệch chuẩn đều tính trong SQL.
+def distribution(school_year_id=None, major_id=None, criteria_id=None, bucket_size=1):
+    if criteria_id is None:
+        field = 'total_score'
+        queryset = Thesis.objects.filter(total_score__isnull=False)
+        prefix = ''
+    else:
+        field = 'score_number'
+        queryset = Score.objects.filter(thesis_criteria__criteria_id=criteria_id)
+        prefix = 'thesis_criteria__thesis__'
+    if school_year_id is not None:
+        queryset = queryset.filter(**{f'{prefix}school_year_id': school_year_id})
+    if major_id is not None:
+        queryset = queryset.filter(**{f'{prefix}major_id': major_id})
+
+    summary = queryset.aggregate(count=Count(field), mean=Avg(field), stddev=StdDev(field),
+                                 min=Min(field), max=Max(field))
+    count = summary['count']
+
+    # Chia khoảng trên điểm nhân SCALE (số nguyên): 0.7 / 0.1 = 6.999… sẽ rơi nhầm vào khoảng trước
+    width = round(bucket_size * SCALE)
+    bucket_count = math.ceil(MAX_SCORE * SCALE / width)
+    counts = [0] * bucket_count
+    rows = (queryset.annotate(bucket=Floor(Round(F(field) * SCALE) / Value(width)))
+            .values('bucket').annotate(bucket_total=Count('pk')).order_by())
+    for item in rows:
+        index = min(max(int(item['bucket']), 0), bucket_count - 1)  # Điểm 10 thuộc khoảng cuối
+        counts[index] += item['bucket_total']
+
+    values = queryset.order_by(field).values_list(field, flat=True)
+    return {
+        'count': count,
+        'mean': round(summary['mean'], 2) if count else None,
+        'stddev': round(summary['stddev'], 2) if count else None,
+        'min': summary['min'],
+        'max': summary['max'],
+        'percentiles': {f'p{percent}': round(percentile(values, count, percent), 2) if count else None
+                        for percent in PERCENTILES},
+        'histogram': [{'start': round(i * width / SCALE, 2), 'end': round(min((i + 1) * width / SCALE, MAX_SCORE), 2),
+                       'count': counts[i]} for i in range(bucket_count)],
+    }
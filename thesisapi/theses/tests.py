@@ -1,3 +1,1108 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APITestCase
+from theses.models import Role, User, Faculty, Major, SchoolYear, Lecturer, Student, Position, Council, \
+    CouncilDetail, Thesis, Criteria, ThesisCriteria, Score, Post, Comment, ScoreSheetJob, OutboundEmail, \
+    SearchEntry, ThesisStat
+from theses import authentication, perms, profiling, reports, rendering, outbox, text, autocomplete, caching, \
+    registry, stats
+from theses.scoring import update_total_score
+
+
+class ThesisDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        for code, name in [('admin', 'Quản trị viên'), ('ministry', 'Giáo vụ'),
+                           ('lecturer', 'Giảng viên'), ('student', 'Sinh viên')]:
+            Role.objects.create(code=code, name=name)
+
+        cls.positions = [Position.objects.create(id=i, name=name) for i, name in
+                         enumerate(['Chủ tịch', 'Thư ký', 'Phản biện', 'Thành viên'], start=1)]
+
+        cls.faculty = Faculty.objects.create(code='IT', name='Công nghệ thông tin')
+        cls.major = Major.objects.create(code='CS', name='Khoa học máy tính', faculty=cls.faculty)
+        cls.school_year = SchoolYear.objects.create(name='2023-2024', start_year=date(2023, 9, 1),
+                                                    end_year=date(2024, 6, 30))
+        cls.council = Council.objects.create(name='Hội đồng 1', description='HĐ 1')
+
+        cls.lecturers = [cls.create_lecturer(f'GV{i:03}', f'Nguyễn Văn Giảng {i}') for i in range(1, 4)]
+        cls.council_details = [CouncilDetail.objects.create(lecturer=lecturer, council=cls.council,
+                                                            position=position)
+                               for lecturer, position in zip(cls.lecturers, cls.positions)]
+
+        cls.thesis = Thesis.objects.create(code='KL001', name='Hệ thống quản lý khóa luận',
+                                           start_date=date(2024, 1, 1), end_date=date(2024, 5, 1),
+                                           report_file='<p>Báo cáo</p>', major=cls.major,
+                                           school_year=cls.school_year, council=cls.council)
+        cls.student = cls.create_student('SV001', 'Trần Thị Sinh', thesis=cls.thesis)
+
+        cls.thesis_criteria = [
+            ThesisCriteria.objects.create(thesis=cls.thesis, weight=weight,
+                                          criteria=Criteria.objects.create(name=f'Tiêu chí {i}'))
+            for i, weight in enumerate([0.5, 0.3, 0.2], start=1)
+        ]
+        registry.reset()  # Dữ liệu danh mục của mỗi lớp test được tạo lại
+
+    def count_queries(self, url):
+        registry.get()  # Registry chỉ nạp một lần cho cả process, không tính vào số truy vấn của request
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    @classmethod
+    def create_user(cls, username, role):
+        return User.objects.create_user(username=username, password='123456', email=f'{username}@ou.edu.vn',
+                                        phone='0123456789', gender='Nam', role_id=role)
+
+    @classmethod
+    def create_lecturer(cls, code, full_name):
+        return Lecturer.objects.create(user=cls.create_user(code.lower(), 'lecturer'), code=code,
+                                       full_name=full_name, birthday=date(1980, 1, 1), address='TP.HCM',
+                                       faculty=cls.faculty)
+
+    @classmethod
+    def create_student(cls, code, full_name, thesis=None):
+        return Student.objects.create(user=cls.create_user(code.lower(), 'student'), code=code,
+                                      full_name=full_name, birthday=date(2002, 1, 1), address='TP.HCM',
+                                      gpa=3.2, major=cls.major, thesis=thesis)
+
+
+@override_settings(SCORE_RECOMPUTE_MODE='sync')
+class TotalScoreTests(ThesisDataMixin, TestCase):
+    def grade(self, council_detail, scores):
+        for thesis_criteria, score_number in zip(self.thesis_criteria, scores):
+            Score.objects.create(thesis_criteria=thesis_criteria, council_detail=council_detail,
+                                 score_number=score_number)
+
+    def test_total_score_is_average_of_weighted_lecturer_scores(self):
+        self.grade(self.council_details[0], [8, 6, 10])  # 7.8
+        self.grade(self.council_details[1], [4, 5, 3])  # 4.1
+
+        self.thesis.refresh_from_db()
+        self.assertEqual(self.thesis.total_score, 5.95)
+        self.assertTrue(self.thesis.result)
+
+    def test_total_score_resets_without_scores(self):
+        self.grade(self.council_details[0], [8, 6, 10])
+        Score.objects.all().delete()
+
+        self.thesis.refresh_from_db()
+        self.assertEqual(self.thesis.total_score, 0)
+        self.assertFalse(self.thesis.result)
+
+    def count_update_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            update_total_score(self.thesis.code)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_scores(self):
+        # 1 truy vấn tổng hợp + đọc giá trị cũ + 1 truy vấn UPDATE, bất kể số tiêu chí và số điểm.
+        # Điểm không đổi (đã tính khi lưu Score) nên không cập nhật bảng thống kê.
+        self.grade(self.council_details[0], [7])
+        few = self.count_update_queries()
+
+        Score.objects.all().delete()
+        for council_detail in self.council_details:
+            self.grade(council_detail, [7, 7, 7])
+        self.assertEqual(Score.objects.count(), 9)
+        self.assertEqual(self.count_update_queries(), few)
+
+
+class DeferredTotalScoreTests(ThesisDataMixin, TestCase):
+    def test_recompute_runs_once_per_transaction(self):
+        with mock.patch('theses.scoring.update_total_score') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for thesis_criteria in self.thesis_criteria:
+                        Score.objects.create(thesis_criteria=thesis_criteria,
+                                             council_detail=self.council_details[0], score_number=8)
+                    update.assert_not_called()
+
+        update.assert_called_once_with(self.thesis.code)
+
+    def test_rolled_back_transaction_does_not_recompute(self):
+        with mock.patch('theses.scoring.update_total_score') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    Score.objects.create(thesis_criteria=self.thesis_criteria[0],
+                                         council_detail=self.council_details[0], score_number=8)
+                    raise RuntimeError
+
+        update.assert_not_called()
+
+
+@override_settings(SCORE_RECOMPUTE_MODE='sync')
+class ScoreBatchTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.lecturers[0].user)
+
+    def submit(self, scores):
+        data = {'thesis': self.thesis.code, 'scores': [
+            {'thesis_criteria': thesis_criteria.id, 'score_number': score_number}
+            for thesis_criteria, score_number in zip(self.thesis_criteria, scores)
+        ]}
+        return self.client.post('/scores/batch/', data, format='json')
+
+    def test_batch_creates_then_updates_sheet(self):
+        response = self.submit([8, 6, 10])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Score.objects.filter(council_detail=self.council_details[0]).count(), 3)
+
+        response = self.submit([10, 10, 10])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Score.objects.filter(council_detail=self.council_details[0]).count(), 3)
+
+        self.thesis.refresh_from_db()
+        self.assertEqual(self.thesis.total_score, 10)
+
+    def count_submit_queries(self, scores):
+        with CaptureQueriesContext(connection) as created:
+            self.submit(scores)
+        with CaptureQueriesContext(connection) as updated:
+            self.submit(scores)
+        Score.objects.all().delete()
+        return len(created), len(updated)
+
+    def test_batch_query_count_does_not_depend_on_criteria(self):
+        self.assertEqual(self.count_submit_queries([8]), self.count_submit_queries([8, 6, 10]))
+
+    def test_batch_refreshes_criteria_distribution(self):
+        ministry = self.create_user('giaovu', 'ministry')
+
+        def criteria_mean():
+            self.client.force_authenticate(ministry)
+            data = self.client.get('/stats/distribution/', {'criteria': self.thesis_criteria[1].criteria_id}).data
+            self.client.force_authenticate(self.lecturers[0].user)
+            return data['mean']
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit([8, 6, 10])
+        self.assertEqual(criteria_mean(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit([8, 10, 4])  # Tổng điểm không đổi (7.8), chỉ điểm tiêu chí thay đổi
+        self.thesis.refresh_from_db()
+        self.assertEqual(self.thesis.total_score, 7.8)
+        self.assertEqual(criteria_mean(), 10)
+
+    def test_batch_rejects_out_of_range_score(self):
+        response = self.submit([8, 11, 10])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Score.objects.exists())
+
+    def test_batch_rejects_locked_council(self):
+        Council.objects.filter(pk=self.council.pk).update(is_lock=True)
+        self.assertEqual(self.submit([8, 6, 10]).status_code, 403)
+
+
+class UserSerializerQueryTests(ThesisDataMixin, APITestCase):
+    def test_comment_page_query_count_is_constant(self):
+        post = Post.objects.create(user=self.student.user, content='<p>Thông báo</p>')
+        post.comment_set.create(user=self.lecturers[0].user, content='Bình luận')
+        url = f'/posts/{post.id}/comments/'
+        expected = self.count_queries(url)
+
+        for lecturer in self.lecturers:
+            post.comment_set.create(user=lecturer.user, content='Bình luận')
+        post.comment_set.create(user=self.student.user, content='Bình luận')
+
+        self.assertEqual(self.count_queries(url), expected)
+
+
+class PostFeedTests(ThesisDataMixin, APITestCase):
+    def create_post(self, user):
+        post = Post.objects.create(user=user, content='<p>Thông báo</p>')
+        post.like_set.create(user=self.student.user)
+        post.comment_set.create(user=self.lecturers[0].user, content='Bình luận')
+        return post
+
+    def test_feed_query_count_is_constant(self):
+        self.client.force_authenticate(self.student.user)
+        self.create_post(self.lecturers[0].user)
+        expected = self.count_queries('/posts/')
+
+        for user in [self.student.user] + [lecturer.user for lecturer in self.lecturers]:
+            self.create_post(user)
+
+        self.assertEqual(self.count_queries('/posts/'), expected)
+
+    def test_feed_counts_and_liked(self):
+        post = self.create_post(self.lecturers[0].user)
+        post.comment_set.create(user=self.student.user, content='Bình luận')
+        call_command('reconcile_post_counters', stdout=StringIO())
+        self.client.force_authenticate(self.student.user)
+
+        result = self.client.get('/posts/').data['results'][0]
+        self.assertEqual((result['like_count'], result['comment_count'], result['liked']), (1, 2, True))
+
+        result = self.client.post(f'/posts/{post.id}/like/').data
+        self.assertEqual((result['like_count'], result['liked']), (0, False))
+
+    def test_comments_are_paginated_by_cursor(self):
+        post = Post.objects.create(user=self.lecturers[0].user, content='<p>Thông báo</p>')
+        comments = [post.comment_set.create(user=self.student.user, content=f'Bình luận {i}') for i in range(7)]
+
+        first = self.client.get(f'/posts/{post.id}/comments/').data
+        second = self.client.get(first['next']).data
+
+        self.assertNotIn('count', first)
+        self.assertIsNone(second['next'])
+        ids = [c['id'] for c in first['results'] + second['results']]
+        self.assertEqual(ids, [c.id for c in reversed(comments)])
+
+    def test_comment_counter_follows_add_and_delete(self):
+        post = Post.objects.create(user=self.lecturers[0].user, content='<p>Thông báo</p>')
+        self.client.force_authenticate(self.student.user)
+
+        comment_id = self.client.post(f'/posts/{post.id}/comment/', {'content': 'Bình luận'}).data['id']
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+        self.assertEqual(self.client.delete(f'/comments/{comment_id}/').status_code, 204)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_drifted_counters_are_not_decremented_below_zero(self):
+        post = self.create_post(self.lecturers[0].user)  # Sinh viên đã thích, có một bình luận
+        Post.objects.filter(pk=post.pk).update(like_count=0, comment_count=0)
+        self.client.force_authenticate(self.student.user)
+        self.assertEqual(self.client.post(f'/posts/{post.id}/like/').data['like_count'], 0)
+
+        self.client.force_authenticate(self.lecturers[0].user)
+        self.assertEqual(self.client.delete(f'/comments/{post.comment_set.get().id}/').status_code, 204)
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (0, 0))
+
+    def test_reconcile_recomputes_drifted_counters(self):
+        post = self.create_post(self.lecturers[0].user)
+        other = self.create_post(self.student.user)
+        Post.objects.filter(pk=post.pk).update(like_count=5, comment_count=0)
+
+        out = StringIO()
+        call_command('reconcile_post_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('Reconciled 2 post counter(s)', out.getvalue())
+        self.assertEqual(list(Post.objects.filter(pk__in=[post.pk, other.pk]).order_by('pk')
+                              .values_list('like_count', 'comment_count')), [(1, 1), (1, 1)])
+
+
+class ThesisListTests(ThesisDataMixin, APITestCase):
+    def test_list_omits_report_content(self):
+        result = self.client.get('/theses/').data['results'][0]
+
+        self.assertNotIn('report_file', result)
+        self.assertTrue(result['has_report'])
+        self.assertEqual(result['report_size'], len(self.thesis.report_file))
+
+    def test_retrieve_includes_report_content(self):
+        result = self.client.get(f'/theses/{self.thesis.code}/').data
+        self.assertEqual(result['report_file'], self.thesis.report_file)
+
+    def test_list_query_count_is_constant(self):
+        self.thesis.lecturers.add(self.create_lecturer('GV101', 'Lê Văn Hướng'))
+        urls = ['/theses/', f'/councils/{self.council.id}/theses/', f'/lecturers/{self.lecturers[2].pk}/theses_review/']
+        expected = [self.count_queries(url) for url in urls]
+
+        for i in range(2, 5):
+            thesis = Thesis.objects.create(code=f'KL00{i}', name=f'Khóa luận {i}', start_date=date(2024, 1, 1),
+                                           end_date=date(2024, 5, 1), major=self.major,
+                                           school_year=self.school_year, council=self.council)
+            thesis.lecturers.add(self.create_lecturer(f'GV10{i}', f'Lê Văn {i}'))
+            self.create_student(f'SV00{i}', f'Phạm Văn {i}', thesis=thesis)
+
+        self.assertEqual([self.count_queries(url) for url in urls], expected)
+
+    def test_reviewer_is_read_from_prefetch(self):
+        result = self.client.get('/theses/').data['results'][0]
+        self.assertEqual(result['reviewer']['code'], self.lecturers[2].code)
+
+    def test_council_theses_omit_report_content(self):
+        result = self.client.get(f'/councils/{self.council.id}/theses/').data[0]
+        self.assertNotIn('report_file', result)
+        self.assertTrue(result['has_report'])
+
+
+class PermissionQueryTests(ThesisDataMixin, TestCase):
+    def request_for(self, user):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=user.pk)
+        return request
+
+    def test_role_permissions_do_not_query(self):
+        ministry = self.create_user('giaovu', 'ministry')
+        for permission, user, allowed in [(perms.IsMinistry(), ministry, True),
+                                          (perms.IsLecturer(), ministry, False),
+                                          (perms.IsLecturer(), self.lecturers[0].user, True),
+                                          (perms.IsStudent(), self.student.user, True),
+                                          (perms.IsStudent(), self.lecturers[0].user, False)]:
+            request = self.request_for(user)
+            with self.assertNumQueries(0):
+                self.assertEqual(permission.has_permission(request, None), allowed)
+
+    def test_owner_permissions_do_not_query(self):
+        owner = self.request_for(self.student.user)
+        other = self.request_for(self.lecturers[1].user)
+        post = Post.objects.get(pk=Post.objects.create(content='Bài đăng', user=self.student.user).pk)
+        comment = Comment.objects.get(pk=Comment.objects.create(content='Bình luận', user=self.student.user,
+                                                                post=post).pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(perms.PostOwner().has_object_permission(owner, None, post))
+            self.assertFalse(perms.PostOwner().has_object_permission(other, None, post))
+            self.assertTrue(perms.CommentOwner().has_object_permission(owner, None, comment))
+            self.assertFalse(perms.CommentOwner().has_object_permission(other, None, comment))
+
+    def test_score_owner_does_not_query(self):
+        score = Score.objects.create(thesis_criteria=self.thesis_criteria[0],
+                                     council_detail=self.council_details[0], score_number=8)
+        score = Score.objects.select_related('council_detail').get(pk=score.pk)
+        owner = self.request_for(self.lecturers[0].user)
+        other = self.request_for(self.lecturers[1].user)
+        with self.assertNumQueries(0):
+            self.assertTrue(perms.ScoreOwner().has_object_permission(owner, None, score))
+            self.assertFalse(perms.ScoreOwner().has_object_permission(other, None, score))
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        profiling.reset()
+
+    def test_records_queries_per_action(self):
+        response = self.client.get('/theses/')
+
+        self.assertIn('desc="', response['Server-Timing'])
+        stats = {item['action']: item for item in profiling.snapshot()}
+        self.assertEqual(stats['ThesisViewSet.list']['requests'], 1)
+        self.assertGreater(stats['ThesisViewSet.list']['avg_queries'], 0)
+        self.assertGreater(stats['ThesisViewSet.list']['avg_serialize_ms'], 0)  # serializer.data, không chỉ JSON
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_stats_endpoint_requires_ministry(self):
+        self.client.get('/theses/')
+        self.assertEqual(self.client.get('/profiling/').status_code, 401)
+
+        self.client.force_authenticate(self.create_user('giaovu', 'ministry'))
+        actions = [item['action'] for item in self.client.get('/profiling/').data['actions']]
+        self.assertIn('ThesisViewSet.list', actions)
+
+
+class ProfilingDisabledTests(ThesisDataMixin, APITestCase):
+    def test_no_header_when_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/theses/'))
+
+
+class MediaRootMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        media_override.enable()
+        cls.addClassCleanup(media_override.disable)
+
+
+@override_settings(SCORE_SHEET_RENDER_MODE='sync', SCORE_RECOMPUTE_MODE='sync')
+class ScoreSheetTests(MediaRootMixin, ThesisDataMixin, APITestCase):
+    def setUp(self):
+        for thesis_criteria, score_number in zip(self.thesis_criteria, [8, 6, 10]):
+            Score.objects.create(thesis_criteria=thesis_criteria, council_detail=self.council_details[0],
+                                 score_number=score_number)
+
+    def generate(self):
+        return self.client.get(f'/theses/{self.thesis.code}/generate-pdf/')
+
+    def test_score_sheet_is_rendered_once_per_data_change(self):
+        with mock.patch('theses.reports.render_score_sheet', wraps=reports.render_score_sheet) as render:
+            first = self.generate()
+            second = self.generate()
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(first.data['file_url'], second.data['file_url'])
+
+            Score.objects.filter(thesis_criteria=self.thesis_criteria[0]).update(score_number=9)
+            third = self.generate()
+            self.assertEqual(render.call_count, 2)
+            self.assertNotEqual(third.data['file_url'], first.data['file_url'])
+
+        self.assertEqual(ScoreSheetJob.objects.filter(thesis=self.thesis).count(), 1)
+
+    def test_score_sheet_lists_lecturer_scores(self):
+        data = reports.score_sheet_data(self.thesis)
+        self.assertEqual(data['lecturers'], [[self.lecturers[0].full_name, 'Chủ tịch', 7.8]])
+        self.assertTrue(reports.render_score_sheet(data).startswith(b'%PDF'))
+
+    def test_font_is_loaded_once(self):
+        with mock.patch('theses.rendering.TTFont') as ttfont:
+            rendering.render_score_sheet(reports.score_sheet_data(self.thesis))
+        ttfont.assert_not_called()
+
+    @override_settings(SCORE_SHEET_RENDER_MODE='async')
+    def test_async_mode_returns_job(self):
+        with mock.patch('theses.reports.get_executor'):
+            response = self.generate()
+
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(f"/score_sheet_jobs/{response.data['id']}/").data
+        self.assertEqual(job['status'], ScoreSheetJob.PENDING)
+
+    @override_settings(SCORE_SHEET_JOB_TIMEOUT=60)
+    def test_abandoned_job_is_requeued(self):
+        with override_settings(SCORE_SHEET_RENDER_MODE='async'), mock.patch('theses.reports.get_executor'):
+            job_id = self.generate().data['id']  # Job không bao giờ được worker xử lý
+            self.assertEqual(self.generate().data['status'], ScoreSheetJob.PENDING)  # Chưa quá thời gian chờ
+
+        ScoreSheetJob.objects.filter(pk=job_id).update(status=ScoreSheetJob.RUNNING,
+                                                       updated_date=timezone.now() - timedelta(minutes=5))
+        self.assertIn('file_url', self.generate().data)
+        self.assertEqual(ScoreSheetJob.objects.get(pk=job_id).status, ScoreSheetJob.DONE)
+
+
+@override_settings(SCORE_SHEET_RENDER_MODE='sync', SCORE_SHEET_PROCESSES=0)
+class ScoreSheetExportTests(MediaRootMixin, ThesisDataMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Thesis.objects.create(code='KL002', name='Ứng dụng di động', start_date=date(2024, 1, 1),
+                              end_date=date(2024, 5, 1), major=cls.major, school_year=cls.school_year,
+                              council=cls.council)
+        cls.ministry = cls.create_user('giaovu', 'ministry')
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_council_export_streams_zip_of_all_theses(self):
+        self.client.force_authenticate(self.ministry)
+
+        with mock.patch('theses.reports.render_score_sheet', wraps=reports.render_score_sheet) as render:
+            self.client.get(f'/theses/{self.thesis.code}/generate-pdf/')  # Phiếu đã có sẵn thì dùng lại
+            archive = self.download(f'/councils/{self.council.id}/score-sheets/')
+
+        self.assertEqual(archive.namelist(), ['score_KL001.pdf', 'score_KL002.pdf'])
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+        self.assertEqual(render.call_count, 2)
+
+    def test_school_year_export(self):
+        self.client.force_authenticate(self.ministry)
+        archive = self.download(f'/school_years/{self.school_year.id}/score-sheets/')
+        self.assertEqual(len(archive.namelist()), 2)
+
+    def test_export_requires_ministry(self):
+        self.client.force_authenticate(self.student.user)
+        self.assertEqual(self.client.get(f'/councils/{self.council.id}/score-sheets/').status_code, 403)
+
+
+@override_settings(EMAIL_OUTBOX_AUTO_SEND=False)
+class OutboxTests(ThesisDataMixin, APITestCase):
+    def test_lock_queues_notifications_without_sending(self):
+        response = self.client.post(f'/councils/{self.council.id}/update_lock/')
+
+        self.assertTrue(response.data['is_lock'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(to=self.student.user.email).count(), 1)
+
+    def test_lock_notifies_only_students_graded_by_council(self):
+        # Khóa luận do thành viên hội đồng hướng dẫn nhưng hội đồng khác chấm
+        other = Thesis.objects.create(code='KL002', name='Khóa luận khác', start_date=date(2024, 1, 1),
+                                      end_date=date(2024, 5, 1), major=self.major, school_year=self.school_year,
+                                      council=Council.objects.create(name='Hội đồng 2', description='HĐ 2'))
+        other.lecturers.add(self.lecturers[0])
+        self.thesis.lecturers.add(self.lecturers[0])
+        self.create_student('SV002', 'Lê Thị Khác', thesis=other)
+        self.create_student('SV003', 'Võ Văn Cùng', thesis=self.thesis)
+
+        with self.assertNumQueries(4):
+            self.client.post(f'/councils/{self.council.id}/update_lock/')
+
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('to', flat=True)),
+                         ['sv001@ou.edu.vn', 'sv003@ou.edu.vn'])
+
+    def test_worker_sends_batch_over_one_connection(self):
+        outbox.queue_emails([('Tiêu đề', 'Nội dung', [f'sv{i}@ou.edu.vn']) for i in range(3)])
+
+        with mock.patch('theses.outbox.get_connection', wraps=outbox.get_connection) as get_connection:
+            call_command('send_outbox', stdout=StringIO())
+
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_email_is_retried_with_backoff(self):
+        email = outbox.queue_email('Tiêu đề', 'Nội dung', ['sv@ou.edu.vn'])[0]
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP')):
+            outbox.send_pending()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+            self.assertGreater(email.next_attempt_date, email.created_date)
+
+            OutboundEmail.objects.update(next_attempt_date=email.created_date)
+            outbox.send_pending()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 2))
+
+    def test_connection_failure_is_recorded_on_every_claimed_email(self):
+        emails = outbox.queue_emails([('Tiêu đề', 'Nội dung', [f'sv{i}@ou.edu.vn']) for i in range(2)])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('Connection refused')):
+            self.assertEqual(outbox.send_pending(), 0)
+            for email in emails:
+                email.refresh_from_db()
+                self.assertEqual((email.status, email.attempts, email.last_error),
+                                 (OutboundEmail.PENDING, 1, 'Connection refused'))
+                self.assertGreater(email.next_attempt_date, timezone.now())
+
+            # Worker --loop vẫn chạy khi một lượt gửi lỗi
+            with mock.patch('theses.outbox.send_pending', side_effect=[OSError('DB'), 0]), \
+                    mock.patch('time.sleep', side_effect=[None, KeyboardInterrupt]):
+                err = StringIO()
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command('send_outbox', '--loop', stdout=StringIO(), stderr=err)
+            self.assertIn('Sending queued emails failed: DB', err.getvalue())
+
+
+class CachedAuthenticationTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('giaovu', 'ministry')
+        application = Application.objects.create(name='app', client_type=Application.CLIENT_CONFIDENTIAL,
+                                                 authorization_grant_type=Application.GRANT_PASSWORD)
+        self.token = AccessToken.objects.create(user=self.user, application=application, token='token-giaovu',
+                                                scope='read write',
+                                                expires=timezone.now() + timedelta(hours=1))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token-giaovu')
+
+    def test_cached_token_skips_token_query(self):
+        self.client.get('/profiling/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/profiling/').status_code, 200)
+        self.assertEqual(len(queries), 1)  # Chỉ lấy user theo id, không đọc bảng AccessToken
+        self.assertNotIn('oauth2_provider_accesstoken', queries[0]['sql'])
+
+    def test_cache_holds_only_compact_fields(self):
+        self.client.get('/profiling/')
+        user_id, role_id, expires, scope, version = cache.get(authentication.token_cache_key('token-giaovu'))
+        self.assertEqual((user_id, role_id, expires, scope), (self.user.pk, 'ministry', self.token.expires,
+                                                              'read write'))
+
+    def test_revoked_token_is_rejected(self):
+        self.count_queries('/profiling/')
+        self.token.revoke()
+        self.assertEqual(self.client.get('/profiling/').status_code, 401)
+
+    def test_user_change_invalidates_cached_user(self):
+        self.count_queries('/profiling/')
+        self.user.role_id = 'student'
+        self.user.save()
+        self.assertEqual(self.client.get('/profiling/').status_code, 403)
+
+    def test_ttl_bounded_by_token_expiry(self):
+        self.token.expires = timezone.now() + timedelta(seconds=30)
+        self.token.save()
+        with mock.patch('theses.authentication.cache.set') as cache_set:
+            self.client.get('/profiling/')
+        self.assertLessEqual(cache_set.call_args.args[2], 30)
+
+
+class SearchTests(ThesisDataMixin, APITestCase):
+    def test_fold_strips_vietnamese_diacritics(self):
+        self.assertEqual(text.fold('  Nguyễn Văn ĐỨC '), 'nguyen van duc')
+
+    def test_accent_insensitive_ranked_results(self):
+        Post.objects.create(content='<p>Lịch bảo vệ <b>khóa luận</b></p>', user=self.student.user)
+
+        response = self.client.get('/search/', {'q': 'khoa luan'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({(item['type'], item['id']) for item in response.data},
+                         {('thesis', 'KL001'), ('post', str(Post.objects.get().pk))})
+
+        response = self.client.get('/search/', {'q': 'nguyen giang', 'type': 'lecturer'})
+        self.assertEqual(len(response.data), 3)
+        ranks = [item['rank'] for item in response.data]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+        response = self.client.get('/search/', {'q': 'Giảng 2'})
+        self.assertEqual([item['title'] for item in response.data], ['Nguyễn Văn Giảng 2'])
+
+    def test_prefix_match_and_type_filter(self):
+        response = self.client.get('/search/', {'q': 'Trần Sin', 'type': 'student,lecturer'})
+        self.assertEqual([(item['type'], item['id']) for item in response.data],
+                         [('student', str(self.student.pk))])
+
+    def test_index_follows_changes(self):
+        self.thesis.name = 'Ứng dụng học máy'
+        self.thesis.save()
+        self.assertEqual(len(self.client.get('/search/', {'q': 'hoc may'}).data), 1)
+        self.assertEqual(len(self.client.get('/search/', {'q': 'quan ly', 'type': 'thesis'}).data), 0)
+
+        self.student.delete()
+        self.assertEqual(len(self.client.get('/search/', {'q': 'tran thi sinh'}).data), 0)
+
+    def test_inactive_posts_are_not_indexed(self):
+        post = Post.objects.create(content='<p>Lịch bảo vệ</p>', user=self.student.user)
+        Post.objects.create(content='<p>Lịch bảo vệ cũ</p>', user=self.student.user, active=False)
+        self.assertEqual([item['id'] for item in self.client.get('/search/', {'q': 'lich bao ve'}).data],
+                         [str(post.pk)])
+
+        post.active = False
+        post.save()
+        self.assertEqual(self.client.get('/search/', {'q': 'lich bao ve'}).data, [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertFalse(SearchEntry.objects.filter(kind=SearchEntry.POST).exists())
+
+    def test_post_list_uses_index(self):
+        Post.objects.create(content='<p>Thông báo nộp báo cáo</p>', user=self.student.user)
+        Post.objects.create(content='<p>Lịch họp hội đồng</p>', user=self.student.user)
+        results = self.client.get('/posts/', {'q': 'nop bao cao'}).data['results']
+        self.assertEqual([post['content'] for post in results], ['<p>Thông báo nộp báo cáo</p>'])
+
+    def test_invalid_queries(self):
+        self.assertEqual(self.client.get('/search/', {'q': '  '}).status_code, 400)
+        self.assertEqual(self.client.get('/search/', {'q': 'a', 'type': 'council'}).status_code, 400)
+
+    def test_rebuild_command(self):
+        SearchEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(SearchEntry.objects.count(), 5)
+        self.assertEqual(len(self.client.get('/search/', {'q': 'KL001'}).data), 1)
+
+
+class NameSearchTests(ThesisDataMixin, APITestCase):
+    def test_search_columns_are_folded_on_save(self):
+        self.student.full_name = 'Đặng Thị Ánh'
+        self.student.save(update_fields=['full_name'])
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.full_name_search, 'dang thi anh')
+        self.assertEqual(Thesis.objects.get().name_search, 'he thong quan ly khoa luan')
+        self.assertEqual(Major.objects.get().name_search, 'khoa hoc may tinh')
+
+    def test_q_is_accent_insensitive(self):
+        results = self.client.get('/lecturers/', {'q': 'nguyen van giang'}).data['results']
+        self.assertEqual(len(results), 3)
+        results = self.client.get('/students/', {'q': 'TRAN thi'}).data['results']
+        self.assertEqual([student['code'] for student in results], ['SV001'])
+        results = self.client.get('/theses/', {'q': 'quan ly'}).data['results']
+        self.assertEqual([thesis['code'] for thesis in results], ['KL001'])
+        self.assertEqual(len(self.client.get('/majors/', {'q': 'khoa hoc'}).data['results']), 1)
+
+    def test_prefix_matches_start_of_name_only(self):
+        self.assertEqual(len(self.client.get('/lecturers/', {'prefix': 'Nguyễn V'}).data['results']), 3)
+        self.assertEqual(len(self.client.get('/lecturers/', {'prefix': 'van'}).data['results']), 0)
+        self.assertEqual(len(self.client.get('/theses/', {'prefix': 'he thong'}).data['results']), 1)
+
+
+class AutocompleteTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset()
+
+    def tearDown(self):
+        autocomplete.reset()
+
+    def suggest(self, **params):
+        response = self.client.get('/autocomplete/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['code']) for item in response.data]
+
+    def test_matches_code_and_any_word_of_name(self):
+        self.assertEqual(self.suggest(q='sv0'), [('student', 'SV001')])
+        self.assertEqual(self.suggest(q='Giảng 2'), [('lecturer', 'GV002')])
+        self.assertEqual(len(self.suggest(q='nguyen v', type='lecturer', limit=2)), 2)
+        self.assertEqual(self.suggest(q='sinh', type='lecturer'), [])
+
+    def test_lookup_does_not_query_after_load(self):
+        self.suggest(q='tran')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest(q='tran'), [('student', 'SV001')])
+
+    def test_index_updated_from_signals(self):
+        self.suggest(q='tran')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_student('SV002', 'Lê Văn Tám')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest(q='le van'), [('student', 'SV002')])
+            self.assertEqual(self.suggest(q='tran'), [])
+
+    def test_rebuilds_when_another_process_changed_data(self):
+        self.suggest(q='tran')
+        cache.set(autocomplete.VERSION_KEY, 'changed-elsewhere', None)
+        Student.objects.filter(pk=self.student.pk).update(full_name='Phạm Văn Sinh')
+        self.assertEqual(self.suggest(q='pham'), [('student', 'SV001')])
+
+
+class ReferenceDataCachingTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_etag_and_cache_control(self):
+        response = self.client.get('/positions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+    def test_not_modified_without_queries(self):
+        for url in ['/positions/', '/school_years/', '/majors/', '/criterias/']:
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(self.client.get('/school_years/')['ETag'],
+                            self.client.get('/school_years/', {'q': '2023'})['ETag'])
+
+    def test_changes_invalidate_etag(self):
+        etag = self.client.get('/majors/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faculty.name = 'Khoa Công nghệ thông tin'
+            self.faculty.save()
+
+        response = self.client.get('/majors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['faculty'], 'Khoa Công nghệ thông tin')
+
+    def test_major_list_loads_faculty_with_join(self):
+        Major.objects.create(code='SE', name='Kỹ thuật phần mềm', faculty=self.faculty)
+        self.assertEqual(self.count_queries('/majors/'), 2)  # COUNT của phân trang + danh sách
+
+
+class TaggedCacheMixin:
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_until_tag_invalidated(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        self.assertEqual(caching.cached('key', ['thesis:KL001', 'council:1'], compute), {'value': 1})
+        self.assertEqual(caching.cached('key', ['thesis:KL001', 'council:1'], compute), {'value': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.invalidate('council:1')
+        self.assertEqual(caching.cached('key', ['thesis:KL001', 'council:1'], compute), {'value': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.invalidate('council:2')
+        self.assertEqual(caching.cached('key', ['thesis:KL001', 'council:1'], compute), {'value': 2})
+
+    def test_invalidation_waits_for_commit(self):
+        caching.cached('key', ['thesis:KL001'], lambda: 'old')
+        with self.captureOnCommitCallbacks() as callbacks:
+            caching.invalidate('thesis:KL001')
+            self.assertEqual(caching.cached('key', ['thesis:KL001'], lambda: 'new'), 'old')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(caching.cached('key', ['thesis:KL001'], lambda: 'new'), 'new')
+
+
+class LocmemTaggedCacheTests(TaggedCacheMixin, TestCase):
+    pass
+
+
+class FileBasedTaggedCacheTests(TaggedCacheMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cls.cache_dir}}))
+        cls.addClassCleanup(shutil.rmtree, cls.cache_dir, ignore_errors=True)
+        super().setUpClass()
+
+
+class CachedEndpointTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_council_members_cached_until_membership_changes(self):
+        url = f'/councils/{self.council.pk}/members/'
+        first = self.count_queries(url)
+        self.assertEqual(self.count_queries(url), 1)  # Chỉ còn get_object
+        self.assertLess(1, first)
+
+        lecturer = self.create_lecturer('GV004', 'Lê Thị Thành Viên')
+        with self.captureOnCommitCallbacks(execute=True):
+            CouncilDetail.objects.create(lecturer=lecturer, council=self.council, position=self.positions[3])
+        self.assertEqual(len(self.client.get(url).data), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lecturer.full_name = 'Lê Thị Đổi Tên'
+            lecturer.save()
+        self.assertIn('Lê Thị Đổi Tên', [member['full_name'] for member in self.client.get(url).data])
+
+    @override_settings(SCORE_RECOMPUTE_MODE='sync')
+    def test_thesis_criteria_follow_scores(self):
+        url = f'/theses/{self.thesis.pk}/criteria/'
+        self.assertEqual([item['scores'] for item in self.client.get(url).data], [[], [], []])
+        self.assertEqual(self.count_queries(url), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.create(thesis_criteria=self.thesis_criteria[0], council_detail=self.council_details[0],
+                                 score_number=9)
+        self.assertEqual(self.client.get(url).data[0]['scores'][0]['score_number'], 9)
+
+    @override_settings(SCORE_RECOMPUTE_MODE='sync')
+    def test_lecturer_theses_follow_thesis_changes(self):
+        lecturer = self.lecturers[1]
+        url = f'/lecturers/{lecturer.pk}/theses/'
+        self.assertEqual(self.client.get(url).data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thesis.lecturers.add(lecturer)
+        self.assertEqual([thesis['code'] for thesis in self.client.get(url).data], ['KL001'])
+        self.assertEqual(self.count_queries(url), 2)  # get_object và danh sách mã khóa luận
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.create(thesis_criteria=self.thesis_criteria[0], council_detail=self.council_details[0],
+                                 score_number=10)
+        self.assertEqual(self.client.get(url).data[0]['total_score'], 5.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.major.name = 'Khoa học dữ liệu'
+            self.major.save()
+        self.assertEqual(self.client.get(url).data[0]['major'], 'Khoa học dữ liệu')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.thesis = None
+            self.student.save()
+        self.assertEqual(self.client.get(url).data[0]['students'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faculty.name = 'Khoa Khoa học máy tính'
+            self.faculty.save()
+        self.assertEqual(self.client.get(url).data[0]['lecturers'][0]['faculty'], 'Khoa Khoa học máy tính')
+
+        self.assertIsNotNone(self.client.get(url).data[0]['reviewer'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.positions[2].name = 'Ủy viên phản biện'  # Không còn vị trí "Phản biện"
+            self.positions[2].save()
+        self.assertIsNone(self.client.get(url).data[0]['reviewer'])
+
+
+class RegistryTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_lookups_do_not_query_after_load(self):
+        registry.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.position_id(registry.REVIEWER), 3)
+            self.assertEqual(registry.position_name('1'), 'Chủ tịch')
+            self.assertIsNone(registry.position_name('abc'))
+            self.assertEqual(registry.faculty_name('IT'), 'Công nghệ thông tin')
+            self.assertEqual(registry.major_name('CS'), 'Khoa học máy tính')
+            self.assertEqual(registry.school_year_name(self.school_year.pk), '2023-2024')
+
+    def test_reloads_after_change_is_committed(self):
+        registry.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.positions[2].name = 'Ủy viên phản biện'
+            self.positions[2].save()
+        self.assertEqual(registry.position_name(3), 'Ủy viên phản biện')
+        self.assertIsNone(registry.position_id(registry.REVIEWER))
+
+    def test_versions_are_checked_once_per_request(self):
+        request_started.send(sender=self.__class__)
+        try:
+            with mock.patch.object(caching, 'model_versions', wraps=caching.model_versions) as versions:
+                registry.major_name('CS')
+                registry.school_year_name(self.school_year.pk)
+                registry.position_name(1)
+            self.assertEqual(versions.call_count, 1)
+        finally:
+            request_finished.send(sender=self.__class__)
+
+        with mock.patch.object(caching, 'model_versions', wraps=caching.model_versions) as versions:
+            registry.major_name('CS')
+            registry.major_name('SE')
+        self.assertEqual(versions.call_count, 2)
+
+    def test_member_manager_checks_positions_by_registry_id(self):
+        lecturer = self.create_lecturer('GV004', 'Lê Thị Thành Viên')
+        data = {'council': self.council.pk, 'lecturer': lecturer.pk}
+        response = self.client.post('/council_details/members/', {**data, 'position': 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['Thông báo'], 'Hội đồng chỉ có một phản biện!')
+
+        response = self.client.post('/council_details/members/', {**data, 'position': 9})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/council_details/members/', {**data, 'position': 4})
+        self.assertEqual(response.status_code, 201)
+
+
+@override_settings(SCORE_RECOMPUTE_MODE='sync')
+class ThesisStatTests(ThesisDataMixin, APITestCase):
+    def stat(self, **filters):
+        return ThesisStat.objects.values('count', 'pass_count', 'score_count', 'score_sum', 'score_sq_sum') \
+            .get(school_year=self.school_year, **filters)
+
+    def create_thesis(self, code, major=None, total_score=None):
+        return Thesis.objects.create(code=code, name=f'Khóa luận {code}', start_date=date(2024, 1, 1),
+                                     end_date=date(2024, 5, 1), major=major or self.major,
+                                     school_year=self.school_year, total_score=total_score)
+
+    def test_stats_follow_scores_and_thesis_changes(self):
+        for thesis_criteria, score_number in zip(self.thesis_criteria, [8, 6, 10]):
+            Score.objects.create(thesis_criteria=thesis_criteria, council_detail=self.council_details[0],
+                                 score_number=score_number)
+        self.assertEqual(self.stat(major=self.major), {'count': 1, 'pass_count': 1, 'score_count': 1,
+                                                       'score_sum': Decimal('7.8'), 'score_sq_sum': Decimal('60.84')})
+
+        self.create_thesis('KL002')
+        self.assertEqual(self.stat(major=self.major)['count'], 2)
+        self.assertEqual(self.stat(major=self.major)['score_count'], 1)  # Chưa có điểm (NULL)
+
+        other = Major.objects.create(code='SE', name='Kỹ thuật phần mềm', faculty=self.faculty)
+        thesis = Thesis.objects.get(code='KL002')
+        thesis.major = other
+        thesis.save()
+        self.assertEqual(self.stat(major=self.major)['count'], 1)
+        self.assertEqual(self.stat(major=other)['count'], 1)
+
+        Score.objects.all().delete()
+        self.thesis.delete()
+        self.assertEqual(self.stat(major=self.major), {'count': 0, 'pass_count': 0, 'score_count': 0,
+                                                       'score_sum': 0, 'score_sq_sum': 0})
+
+    def test_rebuild_command_matches_incremental_stats(self):
+        Score.objects.create(thesis_criteria=self.thesis_criteria[0], council_detail=self.council_details[0],
+                             score_number=9)
+        self.create_thesis('KL002', total_score=6.25)
+        expected = self.stat(major=self.major)
+
+        ThesisStat.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_thesis_stats', stdout=out)
+        self.assertIn('Rebuilt 1 thesis stat row(s)', out.getvalue())
+        self.assertEqual(self.stat(major=self.major), expected)
+
+    def test_thesis_write_and_stats_update_share_a_transaction(self):
+        thesis = self.create_thesis('KL002', total_score=6)
+        thesis.total_score = 9
+        with mock.patch.object(stats, 'apply', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            thesis.save()
+        self.assertEqual(Thesis.objects.get(code='KL002').total_score, 6)
+
+        stale = Thesis.objects.get(code='KL002')
+        update_total_score('KL002')  # Chưa có điểm: tổng điểm về 0 trong CSDL, stale vẫn giữ 6
+        stale.delete()
+        self.assertEqual(self.stat(major=self.major)['score_sum'], 0)  # Không trừ 6 của instance đã cũ
+
+    def test_rebuild_rounds_each_score_like_incremental_stats(self):
+        for i, total_score in enumerate([6.125, 7.333, 8.005], start=2):
+            self.create_thesis(f'KL00{i}', total_score=total_score)
+        expected = self.stat(major=self.major)
+        self.assertEqual(expected['score_sum'], Decimal('21.47'))  # 6.13 + 7.33 + 8.01
+
+        stats.rebuild()
+        self.assertEqual(self.stat(major=self.major), expected)
+
+    def test_stats_endpoint_reads_precomputed_rows(self):
+        self.create_thesis('KL002', total_score=6.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Major.objects.create(code='SE', name='Kỹ thuật phần mềm', faculty=self.faculty)
+        self.client.force_authenticate(self.create_user('giaovu', 'ministry'))
+
+        self.assertEqual(self.count_queries('/stats/'), 2)  # Một truy vấn cho mỗi bảng thống kê
+        data = self.client.get('/stats/').data
+        self.assertEqual(data['avg_score_by_school_year'],
+                         [{'start_year': 2023, 'end_year': 2024, 'avg_score': 3.25}])
+        self.assertEqual([(item['major_name'], item['thesis_count']) for item in data['thesis_major_count']],
+                         [('Khoa học máy tính', 2), ('Kỹ thuật phần mềm', 0)])
+
+    def test_admin_stats_without_scores(self):
+        Thesis.objects.filter(pk=self.thesis.pk).update(total_score=None)
+        call_command('rebuild_thesis_stats', stdout=StringIO())
+        self.client.force_login(User.objects.create_superuser('quantri', 'quantri@ou.edu.vn', '123456'))
+
+        response = self.client.get('/admin/thesis-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'][0]['fail_count'], 1)
+        self.assertIsNone(response.context['avg_score_by_school_year'][0]['avg_score'])
+
+
+@override_settings(SCORE_RECOMPUTE_MODE='sync')
+class ScoreDistributionTests(ThesisDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user('giaovu', 'ministry'))
+        for i, total_score in enumerate([4.5, 6.5, 8, 10], start=2):
+            Thesis.objects.create(code=f'KL00{i}', name=f'Khóa luận {i}', start_date=date(2024, 1, 1),
+                                  end_date=date(2024, 5, 1), major=self.major, school_year=self.school_year,
+                                  total_score=total_score)
+
+    def test_total_score_distribution(self):
+        data = self.client.get('/stats/distribution/', {'school_year': self.school_year.pk, 'bucket': 2.5}).data
+        self.assertEqual(data['count'], 5)  # Gồm KL001 (điểm 0)
+        self.assertEqual(data['mean'], 5.8)
+        self.assertEqual(data['stddev'], 3.41)  # Độ lệch chuẩn tổng thể
+        self.assertEqual((data['min'], data['max']), (0, 10))
+        self.assertEqual(data['percentiles'], {'p25': 4.5, 'p50': 6.5, 'p75': 8, 'p90': 9.2})
+        self.assertEqual([bucket['count'] for bucket in data['histogram']], [1, 1, 1, 2])  # Điểm 10 ở khoảng cuối
+        self.assertEqual(data['histogram'][-1], {'start': 7.5, 'end': 10, 'count': 2})
+
+    def test_decimal_bucket_width(self):
+        for code, total_score in [('KL006', 0.7), ('KL007', 8.7)]:
+            Thesis.objects.create(code=code, name=f'Khóa luận {code}', start_date=date(2024, 1, 1),
+                                  end_date=date(2024, 5, 1), major=self.major, school_year=self.school_year,
+                                  total_score=total_score)
+        histogram = self.client.get('/stats/distribution/', {'bucket': 0.1}).data['histogram']
+        self.assertEqual(len(histogram), 100)
+        self.assertEqual(histogram[7], {'start': 0.7, 'end': 0.8, 'count': 1})
+        self.assertEqual(histogram[87], {'start': 8.7, 'end': 8.8, 'count': 1})
+        self.assertEqual(histogram[6]['count'] + histogram[86]['count'], 0)
+
+    def test_criteria_distribution_and_filters(self):
+        for council_detail, score_number in zip(self.council_details, [7, 9, 8]):
+            Score.objects.create(thesis_criteria=self.thesis_criteria[0], council_detail=council_detail,
+                                 score_number=score_number)
+        criteria_id = self.thesis_criteria[0].criteria_id
+        data = self.client.get('/stats/distribution/', {'criteria': criteria_id, 'major': 'CS'}).data
+        self.assertEqual((data['count'], data['mean'], data['percentiles']['p50']), (3, 8, 8))
+
+        data = self.client.get('/stats/distribution/', {'criteria': criteria_id, 'major': 'SE'}).data
+        self.assertEqual(data['count'], 0)
+        self.assertIsNone(data['mean'])
+        self.assertEqual(sum(bucket['count'] for bucket in data['histogram']), 0)
+
+    def test_cached_until_scores_change(self):
+        url = '/stats/distribution/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Thesis.objects.filter(code='KL005').get().delete()
+        self.assertEqual(self.client.get(url).data['count'], 4)
+
+    def test_invalid_parameters(self):
+        for params in [{'school_year': 'abc'}, {'bucket': '0'}, {'bucket': 'x'}]:
+            self.assertEqual(self.client.get('/stats/distribution/', params).status_code, 400)
+        self.client.force_authenticate(self.student.user)
+        self.assertEqual(self.client.get('/stats/distribution/').status_code, 403)
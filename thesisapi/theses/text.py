@@ -0,0 +1,21 @@
+import re
+import unicodedata
+
+from django.utils.html import strip_tags
+
+
+# Bỏ dấu tiếng Việt và chuyển về chữ thường: "Nguyễn Văn Đức" -> "nguyen van duc"
+def fold(text):
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    return ' '.join(text.lower().split())
+
+
+# Các từ của chuỗi tìm kiếm (đã bỏ dấu, bỏ ký tự đặc biệt)
+def terms(text):
+    return re.findall(r'\w+', fold(text))
+
+
+# Nội dung thuần văn bản của trường RichText
+def plain_text(html):
+    return ' '.join(strip_tags(html or '').replace('&nbsp;', ' ').split())
@@ -14,11 +14,15 @@ r.register('councils', views.CouncilViewSet, 'councils')  # Hội đồng
 r.register('council_details', views.CouncilDetailViewSet, 'council_details')  # Chi tiết hội đồng
 r.register('theses', views.ThesisViewSet, 'theses')  # Khóa luận
 r.register('scores', views.ScoreViewSet, 'scores')  # Điểm
+r.register('score_sheet_jobs', views.ScoreSheetJobViewSet, 'score_sheet_jobs')  # Xuất phiếu chấm điểm
 r.register('criterias', views.CriteriaViewSet, 'criterias')  # Tiêu chí
 r.register('thesiscriterias', views.ThesisCriteriaViewSet, 'thesiscriterias')  # Tiêu chí của khóa luận
 r.register('posts', views.PostViewSet, 'posts')  # Bài đăng
 r.register('comments', views.CommentViewSet, 'comments')  # Bình luận
+r.register('search', views.SearchViewSet, 'search')  # Tìm kiếm
+r.register('autocomplete', views.AutocompleteViewSet, 'autocomplete')  # Gợi ý sinh viên, giảng viên
 r.register('stats', views.ThesisStatsViewSet, 'stats')  # Thống kê
+r.register('profiling', views.ProfilingViewSet, 'profiling')  # Đo hiệu năng
 
 urlpatterns = [
     path('', include(r.urls)),
@@ -1,26 +1,17 @@
-import os
-from io import BytesIO
 from django.contrib.auth.hashers import make_password
-from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage, default_storage
-from django.db.models import Avg, Count, F
-from django.db.models.functions import ExtractYear
-from django.http import Http404, HttpResponse
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle
+from django.db import transaction
+from django.db.models import F, Exists, OuterRef
+from django.http import Http404
 from rest_framework import viewsets, generics, status, parsers, permissions
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from theses.models import *
-from theses import serializers, paginators, perms
-from django.core.mail import EmailMessage
+from theses import serializers, paginators, perms, profiling, reports, outbox, search, autocomplete, caching, \
+    registry, stats
 from django.conf import settings
-from theses.signals import update_total_score
+from theses.scoring import schedule_total_score
 
 
 # Người dùng
@@ -55,14 +46,14 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
 
 
 # Vị trí
-class PositionViewSet(viewsets.ViewSet, generics.ListAPIView):
+class PositionViewSet(caching.ConditionalListMixin, viewsets.ViewSet, generics.ListAPIView):
     queryset = Position.objects.all()
     serializer_class = serializers.PositionSerializer
     pagination_class = paginators.BasePaginator
 
 
 # Năm học
-class SchoolYearViewSet(viewsets.ViewSet, generics.ListAPIView):
+class SchoolYearViewSet(caching.ConditionalListMixin, viewsets.ViewSet, generics.ListAPIView):
     queryset = SchoolYear.objects.all()
     serializer_class = serializers.SchoolYearSerializer
     parser_classes = [parsers.MultiPartParser]
@@ -77,20 +68,30 @@ class SchoolYearViewSet(viewsets.ViewSet, generics.ListAPIView):
 
         return queryset
 
+    def get_permissions(self):
+        if self.action in ['score_sheets']:
+            return [perms.IsMinistry()]
+        return [permissions.AllowAny()]
+
+    # Tải phiếu chấm điểm của tất cả khóa luận trong năm học (file ZIP)
+    @action(methods=['get'], url_path='score-sheets', detail=True)
+    def score_sheets(self, request, pk=None):
+        school_year = self.get_object()
+        return reports.score_sheets_response(Thesis.objects.filter(school_year=school_year).order_by('code'),
+                                             f'score_sheets_school_year_{school_year.id}.zip')
+
 
 # Ngành học (Quản lý trong Admin, Giáo vụ)
-class MajorViewSet(viewsets.ViewSet, generics.ListAPIView):
+class MajorViewSet(caching.ConditionalListMixin, viewsets.ViewSet, generics.ListAPIView):
     queryset = Major.objects.all()
     serializer_class = serializers.MajorSerializer
+    cache_models = [Major, Faculty]  # Danh sách ngành hiển thị tên khoa
     pagination_class = paginators.BasePaginator
     parser_classes = [parsers.MultiPartParser]
 
     def get_queryset(self):
-        queryset = self.queryset
-
-        q = self.request.query_params.get('q')
-        if q:
-            queryset = queryset.filter(name__icontains=q)
+        queryset = search.filter_by_name(self.queryset, 'name_search', self.request.query_params.get('q'),
+                                         self.request.query_params.get('prefix'))
 
         fac_id = self.request.query_params.get('faculty_id')
         if fac_id:
@@ -107,11 +108,8 @@ class LecturerViewSet(viewsets.ViewSet, generics.ListAPIView):
     parser_classes = [parsers.MultiPartParser]
 
     def get_queryset(self):
-        queryset = self.queryset
-
-        q = self.request.query_params.get('q')
-        if q:
-            queryset = queryset.filter(full_name__icontains=q)
+        queryset = search.filter_by_name(self.queryset, 'full_name_search', self.request.query_params.get('q'),
+                                         self.request.query_params.get('prefix'))
 
         fac_id = self.request.query_params.get('faculty_id')
         if fac_id:
@@ -131,21 +129,27 @@ class LecturerViewSet(viewsets.ViewSet, generics.ListAPIView):
     @action(detail=True, methods=['get'])
     def theses(self, request, pk=None):
         lecturer = self.get_object()
-        theses = Thesis.objects.filter(lecturers=lecturer)
-        serializer = serializers.ThesisSerializer(theses, many=True)
-        return Response(serializer.data)
+        codes = sorted(Thesis.lecturers.through.objects.filter(lecturer=lecturer).values_list('thesis_id', flat=True))
+
+        def compute():
+            theses = Thesis.objects.filter(code__in=codes).order_by('code').with_related().without_report()
+            return serializers.ThesisListSerializer(theses, many=True).data
+
+        # Danh sách có tên ngành, năm học, khoa (của giảng viên) và phản biện (theo vị trí trong hội đồng)
+        tags = [f'lecturer:{lecturer.pk}'] + \
+               [caching.model_tag(model) for model in [Major, SchoolYear, Faculty, Position]] + \
+               [f'thesis:{code}' for code in codes]
+        return Response(caching.cached(f'lecturer_theses:{lecturer.pk}', tags, compute))
 
     # Lấy khóa luận giảng viên phản biện
     @action(detail=True, methods=['get'])
     def theses_review(self, request, pk=None):
         lecturer = self.get_object()
-        review_positions = Position.objects.filter(name__icontains='Phản biện')
-        council_details = (CouncilDetail.objects.filter(lecturer=lecturer, position__in=review_positions)
-                           .select_related('council'))
-        council_ids = council_details.values_list('council_id', flat=True)
-        theses = (Thesis.objects.filter(council_id__in=council_ids).select_related('major', 'school_year', 'council')
-                  .prefetch_related('lecturers'))
-        serializer = serializers.ThesisSerializer(theses, many=True)
+        council_ids = (CouncilDetail.objects.filter(lecturer=lecturer,
+                                                    position_id=registry.position_id(registry.REVIEWER))
+                       .values_list('council_id', flat=True))
+        theses = Thesis.objects.filter(council_id__in=council_ids).with_related().without_report()
+        serializer = serializers.ThesisListSerializer(theses, many=True)
         return Response(serializer.data)
 
 
@@ -157,11 +161,8 @@ class StudentViewSet(viewsets.ViewSet, generics.ListAPIView):
     parser_classes = [parsers.MultiPartParser, ]
 
     def get_queryset(self):
-        queryset = self.queryset
-
-        q = self.request.query_params.get('q')
-        if q:
-            queryset = queryset.filter(full_name__icontains=q)
+        queryset = search.filter_by_name(self.queryset, 'full_name_search', self.request.query_params.get('q'),
+                                         self.request.query_params.get('prefix'))
 
         maj_id = self.request.query_params.get('major_id')
         if maj_id:
@@ -190,6 +191,11 @@ class CouncilViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIV
 
         return queryset
 
+    def get_permissions(self):
+        if self.action in ['score_sheets']:
+            return [perms.IsMinistry()]
+        return [permissions.AllowAny()]
+
     # Sửa thông tin hội đồng
     def partial_update(self, request, pk=None):
         council = self.get_object()
@@ -205,7 +211,7 @@ class CouncilViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIV
         council = self.get_object()
         old_lock_status = council.is_lock
         council.is_lock = not council.is_lock
-        council.save()
+        council.save(update_fields=['is_lock'])
 
         # if not old_lock_status and council.is_lock:
         #     for council_detail in council.councildetail_set.all():
@@ -213,23 +219,17 @@ class CouncilViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIV
         #             self.send_score_notification_email(student, council_detail.lecturer.thesis_set.first().total_score)
 
         if not old_lock_status and council.is_lock:
-            for council_detail in council.councildetail_set.all():
-                theses = council_detail.lecturer.thesis_set.all()
-                if not theses.exists():
-                    continue
+            # Sinh viên của các khóa luận do hội đồng chấm (mỗi sinh viên chỉ có một khóa luận nên không trùng)
+            students = (Student.objects.filter(thesis__council=council)
+                        .select_related('user', 'thesis').defer('thesis__report_file').order_by('thesis_id', 'code'))
+            messages = [self.score_notification_email(student, student.thesis.total_score) for student in students]
 
-                for thesis in theses:
-                    students = thesis.student_set.all()
-                    if not students.exists():
-                        continue
-
-                    for student in students:
-                        self.send_score_notification_email(student, thesis.total_score)
+            # Email được đưa vào outbox và gửi ở nền, không chặn phản hồi
+            outbox.queue_emails(messages)
 
         return Response({'is_lock': council.is_lock}, status=status.HTTP_200_OK)
 
-    def send_score_notification_email(self, student, total_score):
-        student_email = student.user.email
+    def score_notification_email(self, student, total_score):
         subject = 'Thông báo điểm khóa luận'
         message = (
             f'Điểm của khóa luận "{student.thesis.name}" đã được chấm.\n'
@@ -237,23 +237,25 @@ class CouncilViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIV
             'Mọi thắc mắc vui lòng liên hệ hội đồng trong vòng 3 - 5 ngày kể từ ngày nhận thông báo.\n'
             '__Giáo vụ__'
         )
-
-        from_email = 'Thesis Management <{}>'.format(settings.DEFAULT_FROM_EMAIL)
-        email = EmailMessage(subject, message, from_email, to=[student_email])
-        email.send()
+        return subject, message, [student.user.email]
 
     # Lấy danh sách thành viên trong hội đồng
     @action(detail=True, methods=['get'], url_path='members')
     def get_members(self, request, pk=None):
         try:
             council = self.get_object()
-            members = CouncilDetail.objects.filter(council=council).select_related('lecturer', 'position')
-            members_data = [{
-                "id": member.id,
-                "lecturer_id": member.lecturer.user_id,
-                "full_name": member.lecturer.full_name,
-                "position": member.position.name
-            } for member in members]
+
+            def compute():
+                members = CouncilDetail.objects.filter(council=council).select_related('lecturer', 'position')
+                return [{
+                    "id": member.id,
+                    "lecturer_id": member.lecturer.user_id,
+                    "full_name": member.lecturer.full_name,
+                    "position": member.position.name
+                } for member in members]
+
+            members_data = caching.cached(f'council_members:{council.pk}',
+                                          [f'council:{council.pk}', caching.model_tag(Position)], compute)
             return Response(members_data, status=status.HTTP_200_OK)
         except Council.DoesNotExist:
             return Response({'Thông báo': 'Không tìm thấy hội đồng!'}, status=status.HTTP_404_NOT_FOUND)
@@ -263,12 +265,19 @@ class CouncilViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIV
     def get_theses(self, request, pk=None):
         try:
             council = self.queryset.get(pk=pk)
-            theses = council.thesis_set.all()
-            serializer = serializers.ThesisSerializer(theses, many=True)
+            theses = council.thesis_set.with_related().without_report()
+            serializer = serializers.ThesisListSerializer(theses, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Council.DoesNotExist:
             return Response({'Thông báo': 'Không tìm thấy hội đồng!'}, status=status.HTTP_404_NOT_FOUND)
 
+    # Tải phiếu chấm điểm của tất cả khóa luận hội đồng chấm (file ZIP)
+    @action(methods=['get'], url_path='score-sheets', detail=True)
+    def score_sheets(self, request, pk=None):
+        council = self.get_object()
+        return reports.score_sheets_response(Thesis.objects.filter(council=council).order_by('code'),
+                                             f'score_sheets_council_{council.id}.zip')
+
     # Gán hội đồng vào khóa luận
     @action(detail=True, methods=['post'], url_path='assign-thesis')
     def assign_thesis(self, request, pk=None):
@@ -325,10 +334,7 @@ class CouncilDetailViewSet(viewsets.ViewSet, generics.DestroyAPIView):
             '__Giáo vụ__'
         )
 
-        from_email = 'Thesis Management <{}>'.format(settings.DEFAULT_FROM_EMAIL)
-
-        email = EmailMessage(subject, message, from_email, to=[lecturer_email])
-        email.send()
+        outbox.queue_email(subject, message, [lecturer_email])
 
     # Thêm, sửa thành viên hội đồng
     @action(detail=False, methods=['post', 'patch'], url_path='members')
@@ -347,29 +353,26 @@ class CouncilDetailViewSet(viewsets.ViewSet, generics.DestroyAPIView):
         if council_details.count() >= 5:
             return Response({'Thông báo': 'Một hội đồng chỉ có tối đa năm thành viên!'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Đếm số lượng từng vị trí bằng ID
-        position_counts = {
-            1: 0,  # ID của chủ tịch
-            2: 0,  # ID của thư ký
-            3: 0  # ID của phản biện
-        }
+        # Đếm số lượng từng vị trí (id lấy theo tên từ registry)
+        chairman_id = registry.position_id(registry.CHAIRMAN)
+        secretary_id = registry.position_id(registry.SECRETARY)
+        reviewer_id = registry.position_id(registry.REVIEWER)
+        position_counts = {chairman_id: 0, secretary_id: 0, reviewer_id: 0}
 
         for detail in council_details:
-            pos_id = detail.position.id
-            if pos_id in position_counts:
-                position_counts[pos_id] += 1
+            if detail.position_id in position_counts:
+                position_counts[detail.position_id] += 1
 
-        try:
-            position = Position.objects.get(id=position_id)
-        except Position.DoesNotExist:
+        if registry.position_name(position_id) is None:
             return Response({'Thông báo': 'Vị trí không tồn tại!'}, status=status.HTTP_404_NOT_FOUND)
+        position_id = int(position_id)
 
         # Kiểm tra vị trí bằng ID
-        if position.id == 1 and position_counts[1] >= 1:
+        if position_id == chairman_id and position_counts[chairman_id] >= 1:
             return Response({'Thông báo': 'Hội đồng chỉ có một chủ tịch!'}, status=status.HTTP_400_BAD_REQUEST)
-        if position.id == 2 and position_counts[2] >= 1:
+        if position_id == secretary_id and position_counts[secretary_id] >= 1:
             return Response({'Thông báo': 'Hội đồng chỉ có một thư ký!'}, status=status.HTTP_400_BAD_REQUEST)
-        if position.id == 3 and position_counts[3] >= 1:
+        if position_id == reviewer_id and position_counts[reviewer_id] >= 1:
             return Response({'Thông báo': 'Hội đồng chỉ có một phản biện!'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
@@ -389,7 +392,7 @@ class CouncilDetailViewSet(viewsets.ViewSet, generics.DestroyAPIView):
                 council_detail = serializer.save()
 
                 # Gửi email nếu là phản biện
-                if position.id == 3:
+                if position_id == reviewer_id:
                     self.send_reviewer_email(council, lecturer)
 
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -401,15 +404,10 @@ class CouncilDetailViewSet(viewsets.ViewSet, generics.DestroyAPIView):
             except CouncilDetail.DoesNotExist:
                 return Response({'Thông báo': 'Thành viên hội đồng không tồn tại!'}, status=status.HTTP_404_NOT_FOUND)
 
-            try:
-                position = Position.objects.get(id=position_id)
-            except Position.DoesNotExist:
-                return Response({'Thông báo': 'Vị trí không tồn tại!'}, status=status.HTTP_404_NOT_FOUND)
-
-            council_detail.position = position
+            council_detail.position_id = position_id
             council_detail.save()
 
-            if position.id == 3:
+            if position_id == reviewer_id:
                 council = Council.objects.get(id=council_id)
                 lecturer = Lecturer.objects.get(user_id=lecturer_id)
                 self.send_reviewer_email(council, lecturer)
@@ -427,13 +425,13 @@ class CouncilDetailViewSet(viewsets.ViewSet, generics.DestroyAPIView):
 
 # Khóa luận
 class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.RetrieveAPIView, generics.DestroyAPIView):
-    queryset = Thesis.objects.prefetch_related('lecturers').all().order_by('-code')
+    queryset = Thesis.objects.order_by('-code')
     serializer_class = serializers.ThesisSerializer
     parser_classes = [parsers.MultiPartParser, ]
     pagination_class = paginators.ThesisPaginator
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = self.queryset.with_related()  # Gọi mỗi request: id vị trí phản biện lấy từ registry
 
         # Lọc theo các tham số truy vấn
         q = self.request.query_params.get('q')
@@ -441,8 +439,7 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
         major_id = self.request.query_params.get('major_id')
         school_year_id = self.request.query_params.get('school_year_id')
 
-        if q:
-            queryset = queryset.filter(name__icontains=q)
+        queryset = search.filter_by_name(queryset, 'name_search', q, self.request.query_params.get('prefix'))
         if council_id:
             queryset = queryset.filter(council_id=council_id)
         if major_id:
@@ -450,8 +447,16 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
         if school_year_id:
             queryset = queryset.filter(school_year_id=school_year_id)
 
+        if self.action == 'list':
+            queryset = queryset.without_report()
+
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return serializers.ThesisListSerializer
+        return self.serializer_class
+
     # Sửa thông tin
     def partial_update(self, request, pk=None):
         thesis = self.get_object()
@@ -459,7 +464,7 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
 
         if serializer.is_valid():
             serializer.save()
-            update_total_score(thesis.code)
+            schedule_total_score(thesis.code)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -512,6 +517,7 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
         student.thesis = thesis
         student.save()
 
+        thesis = self.get_object()  # Lấy lại để danh sách sinh viên đã prefetch được cập nhật
         serializer = self.get_serializer(thesis)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -519,13 +525,18 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
     @action(detail=True, methods=['get'], url_path='criteria')
     def get_thesis_criteria(self, request, pk=None):
         try:
-            thesis = Thesis.objects.prefetch_related('thesiscriteria_set__criteria').get(pk=pk)
-            thesis_criteria = thesis.thesiscriteria_set.all()
-            serializer = serializers.ThesisCriteriaSerializer(thesis_criteria, many=True)
-            return Response(serializer.data)
+            thesis = Thesis.objects.only('code').get(pk=pk)
         except Thesis.DoesNotExist:
             return Response({"Thông báo": "Không tìm thấy khóa luận!"}, status=status.HTTP_404_NOT_FOUND)
 
+        def compute():
+            thesis_criteria = (ThesisCriteria.objects.filter(thesis=thesis).select_related('criteria')
+                               .prefetch_related('score_set').order_by('id'))
+            return serializers.ThesisCriteriaSerializer(thesis_criteria, many=True).data
+
+        return Response(caching.cached(f'thesis_criteria:{thesis.pk}',
+                                       [f'thesis:{thesis.pk}', caching.model_tag(Criteria)], compute))
+
     # Lấy điểm giảng viên chấm cho KL
     @action(detail=True, methods=['get'], url_path='lecturer-scores')
     def get_lecturer_scores(self, request, pk=None):
@@ -555,175 +566,35 @@ class ThesisViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Retri
 
         return Response(response_data, status=status.HTTP_200_OK)
 
-    # Xuất bản điểm ra file PDF
+    # Xuất bản điểm ra file PDF: trả về file đã tạo nếu dữ liệu không đổi, ngược lại đưa vào hàng đợi
     @action(detail=True, methods=['get'], url_path='generate-pdf')
     def generate_pdf(self, request, pk=None):
-        thesis = get_object_or_404(Thesis, pk=pk)
-
-        total_score = thesis.total_score
-        major_name = thesis.major.name
-        students = thesis.student_set.all()
-        instructors = thesis.lecturers.all()
-        council_name = thesis.council.name
-
-        lecturer_total_scores = {}
-        for thesis_criteria in thesis.thesiscriteria_set.all():
-            scores = Score.objects.filter(thesis_criteria=thesis_criteria)
-            for score in scores:
-                lecturer_id = score.council_detail.lecturer.pk
-                weighted_score = score.score_number * thesis_criteria.weight
-                position = score.council_detail.position  # Lấy chức vụ của giảng viên
-
-                if lecturer_id not in lecturer_total_scores:
-                    lecturer_total_scores[lecturer_id] = {
-                        'lecturer': score.council_detail.lecturer.full_name,
-                        'score': weighted_score,
-                        'position': position  # Lưu chức vụ
-                    }
-                else:
-                    lecturer_total_scores[lecturer_id]['score'] += weighted_score
-
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="score_sheet_{thesis.code}.pdf"'
-
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        page_width, page_height = letter
-
-        font_path = os.path.join(os.path.dirname(__file__), 'static/fonts/tahoma.ttf')
-        pdfmetrics.registerFont(TTFont('Tahoma', font_path))
-
-        pdf.setFont("Tahoma", 12)
-
-        text_width = pdf.stringWidth("BỘ GIÁO DỤC VÀ ĐẠO TẠO", "Tahoma", 12)
-        text_height = 800
-
-        pdf.drawString((350 - text_width) / 2, text_height, "BỘ GIÁO DỤC VÀ ĐẠO TẠO")
-
-        text_width = pdf.stringWidth("TRƯỜNG ĐẠI HỌC MỞ TP. HỒ CHÍ MINH", "Tahoma", 12)
-
-        pdf.drawString((350 - text_width) / 2, text_height - 20, "TRƯỜNG ĐẠI HỌC MỞ TP. HỒ CHÍ MINH")
-
-        title = f"PHIẾU CHẤM ĐIỂM"
-        title_width = pdf.stringWidth(title, "Tahoma", 12)
-        pdf.drawString(500 - title_width, 800, title)
-
-        y_position = 740
-
-        pdf.setFont("Tahoma", 14)
-
-        thesis_title = f"ĐỀ TÀI: {thesis.name}"
-        thesis_title_width = pdf.stringWidth(thesis_title, "Tahoma", 12)
-
-        pdf.drawString((letter[0] - thesis_title_width) / 2 - 35, letter[1] - 50, thesis_title)
-
-        lecturer_total_scores = {}
-        for thesis_criteria in thesis.thesiscriteria_set.all():
-            scores = Score.objects.filter(thesis_criteria=thesis_criteria)
-            for score in scores:
-                lecturer_id = score.council_detail.lecturer.pk
-                weighted_score = score.score_number * thesis_criteria.weight
-                position = score.council_detail.position.name if score.council_detail.position else ''
-
-                if lecturer_id not in lecturer_total_scores:
-                    lecturer_total_scores[lecturer_id] = {
-                        'lecturer': score.council_detail.lecturer.full_name,
-                        'score': weighted_score,
-                        'position': position,
-                    }
-                else:
-                    lecturer_total_scores[lecturer_id]['score'] += weighted_score
-
-        pdf.drawString(50, page_height - 100, f"Ngành: {major_name}")
-
-        pdf.drawString(50, page_height - 130, "Danh sách sinh viên thực hiện:")
-        student_start_y = page_height - 160
-        for student in students:
-            pdf.drawString(60, student_start_y, f"Mã SV: {student.code}")
-            pdf.drawString(170, student_start_y, f"Tên: {student.full_name}")
-            pdf.drawString(340, student_start_y, f"Ngành: {student.major.name}")
-            student_start_y -= 30
-
-        pdf.drawString(50, page_height - 250, "Danh sách giảng viên hướng dẫn:")
-        counselor_start_y = page_height - 280
-        for instructor in instructors:
-            pdf.drawString(60, counselor_start_y, f"Mã GV: {instructor.code}")
-            pdf.drawString(170, counselor_start_y, f"Tên: {instructor.full_name}")
-            counselor_start_y -= 30
-
-        pdf.drawString(50, page_height - 370, f"Hội đồng chấm khóa luận: {council_name}")
-
-        # Vẽ bảng điểm
-        pdf.setFont("Tahoma", 12)
-        data = [['TÊN GIẢNG VIÊN', 'CHỨC VỤ', 'ĐIỂM']]
-        for lecturer_id, info in lecturer_total_scores.items():
-            data.append([info['lecturer'], info['position'], f"{info['score']}"])
+        thesis = get_object_or_404(Thesis.objects.select_related('major', 'council').without_report(), pk=pk)
+        job = reports.request_score_sheet(thesis)
 
-        data.append(['', 'TỔNG ĐIỂM', f"{total_score}"])
-
-        col_widths = [page_width * 0.4, page_width * 0.2, page_width * 0.2]  # Cập nhật độ rộng các cột
-        row_height = 20
-        table_width = sum(col_widths)
-
-        table = Table(data, colWidths=col_widths, rowHeights=row_height)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Tahoma'),  # Đặt font Tahoma cho toàn bộ bảng
-            ('FONTSIZE', (0, 0), (-1, -1), 12),  # Đặt kích thước font
-            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-        ]))
-
-        table.wrapOn(pdf, table_width, 400)
-
-        table_x = 50
-        table_y = page_height - 500
-
-        table.drawOn(pdf, table_x, table_y)
-
-        pdf.setFont("Tahoma", 12)
-        date_string = f"TP. Hồ Chí Minh, Ngày......Tháng......Năm......"
-        signature_string = "Chữ ký lãnh đạo (Ký và ghi rõ họ tên)"
-        date_string_width = pdf.stringWidth(date_string, "Tahoma", 12)
-        signature_string_width = pdf.stringWidth(signature_string, "Tahoma", 12)
-
-        margin = 50
-
-        max_string_width = max(date_string_width, signature_string_width)
-        start_x = pdf._pagesize[0] - max_string_width - margin
-        date_y = margin + 180
-        signature_y = margin + 160
-
-        pdf.drawString(start_x, date_y, date_string)
-        pdf.drawString(start_x + 15, signature_y, signature_string)
-
-        pdf.save()
-
-        buffer.seek(0)
-        pdf_data = buffer.read()
-
-        if not pdf_data.startswith(b'%PDF'):
+        if job.status == ScoreSheetJob.DONE:
+            return Response({'file_url': request.build_absolute_uri(default_storage.url(job.file))})
+        if job.status == ScoreSheetJob.FAILED:
             return Response({'Thông báo': 'Xuất file PDF thất bại!'}, status=500)
 
-        buffer.close()
+        serializer = serializers.ScoreSheetJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
-        filename = f"score_{thesis.code}.pdf"
-        file_path = default_storage.save(os.path.join('media', filename), ContentFile(pdf_data))
-        file_url = default_storage.url(file_path)
 
-        return Response({'file_url': request.build_absolute_uri(file_url)})
+# Yêu cầu xuất phiếu chấm điểm
+class ScoreSheetJobViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
+    queryset = ScoreSheetJob.objects.all()
+    serializer_class = serializers.ScoreSheetJobSerializer
 
 
 # Điểm
 class ScoreViewSet(viewsets.ViewSet, generics.CreateAPIView):
-    queryset = Score.objects.all()
+    queryset = Score.objects.select_related('council_detail')
     serializer_class = serializers.ScoreSerializer
     parser_classes = [parsers.MultiPartParser]
 
     def get_permissions(self):
-        if self.action in ['create']:
+        if self.action in ['create', 'batch']:
             return [perms.IsAuthenticated()]
         if self.action in ['update']:
             return [perms.ScoreOwner()]
@@ -785,11 +656,12 @@ class ScoreViewSet(viewsets.ViewSet, generics.CreateAPIView):
 
         serializer = serializers.ScoreSerializer(data=data, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():  # Điểm tổng được tính lại một lần sau khi commit
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def partial_update (self, request, pk=None):
+    def partial_update(self, request, pk=None):
         user = request.user
 
         # Extract and validate data from request
@@ -799,11 +671,12 @@ class ScoreViewSet(viewsets.ViewSet, generics.CreateAPIView):
             return Response({"Thông báo": "Điểm không được bỏ trống!"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            score = Score.objects.get(id=pk)
+            score = (Score.objects.select_related('council_detail', 'thesis_criteria__thesis__council')
+                     .defer('thesis_criteria__thesis__report_file').get(id=pk))
         except Score.DoesNotExist:
             return Response({"Thông báo": "Điểm không tồn tại!"}, status=status.HTTP_404_NOT_FOUND)
 
-        if score.council_detail.lecturer.user != user:
+        if score.council_detail.lecturer_id != user.pk:
             return Response({"Thông báo": "Bạn không có quyền chỉnh sửa điểm này!"}, status=status.HTTP_403_FORBIDDEN)
 
         if score.thesis_criteria.thesis.council.is_lock:
@@ -814,14 +687,91 @@ class ScoreViewSet(viewsets.ViewSet, generics.CreateAPIView):
             return Response({"Thông báo": "Điểm phải nằm trong khoảng từ 0 đến 10!"}, status=status.HTTP_400_BAD_REQUEST)
 
         score.score_number = score_number
-        score.save()
+        with transaction.atomic():
+            score.save()
 
         serializer = serializers.ScoreSerializer(score, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    # Chấm điểm toàn bộ tiêu chí của khóa luận trong một lần gửi
+    @action(detail=False, methods=['post'], url_path='batch', parser_classes=[parsers.JSONParser])
+    def batch(self, request):
+        user = request.user
+        thesis_code = request.data.get('thesis')
+        items = request.data.get('scores')
+
+        if not thesis_code or not isinstance(items, list) or not items:
+            return Response({"Thông báo": "Khóa luận và danh sách điểm không được bỏ trống!"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            score_numbers = {}
+            for item in items:
+                thesis_criteria_id = int(item['thesis_criteria'])
+                if thesis_criteria_id in score_numbers:
+                    return Response({"Thông báo": "Một tiêu chí chỉ được chấm một lần!"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                score_numbers[thesis_criteria_id] = float(item['score_number'])
+        except (KeyError, TypeError, ValueError):
+            return Response({"Thông báo": "ID của tiêu chí phải là số nguyên và điểm phải là số!"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if not all(0 <= score_number <= 10 for score_number in score_numbers.values()):
+            return Response({"Thông báo": "Điểm phải nằm trong khoảng từ 0 đến 10!"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            thesis = Thesis.objects.select_related('council').get(code=thesis_code)
+        except Thesis.DoesNotExist:
+            return Response({"Thông báo": "Khóa luận không tồn tại!"}, status=status.HTTP_404_NOT_FOUND)
+
+        if not thesis.report_file:
+            return Response({"Thông báo": "Khóa luận chưa có báo cáo, không thể chấm điểm!"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        council_detail = CouncilDetail.objects.filter(lecturer_id=user.pk, council_id=thesis.council_id).first()
+        if not council_detail:
+            if not hasattr(user, 'lecturer'):
+                return Response({"Thông báo": "Bạn không phải là giảng viên!"}, status=status.HTTP_403_FORBIDDEN)
+            return Response({"Thông báo": "Bạn không phải là thành viên của hội đồng chấm khóa luận này!"},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if thesis.council.is_lock:
+            return Response({"Thông báo": f"Hội đồng {thesis.council.name} đã bị khóa và không thể chấm hay chỉnh sửa điểm!"},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        criteria_ids = set(ThesisCriteria.objects.filter(thesis=thesis, id__in=score_numbers.keys())
+                           .values_list('id', flat=True))
+        if criteria_ids != score_numbers.keys():
+            return Response({"Thông báo": "Tiêu chí khóa luận không tồn tại!"}, status=status.HTTP_404_NOT_FOUND)
+
+        existing_scores = {score.thesis_criteria_id: score for score in
+                           Score.objects.filter(council_detail=council_detail, thesis_criteria_id__in=criteria_ids)}
+
+        new_scores, updated_scores = [], []
+        for thesis_criteria_id, score_number in score_numbers.items():
+            score = existing_scores.get(thesis_criteria_id)
+            if score:
+                score.score_number = score_number
+                updated_scores.append(score)
+            else:
+                new_scores.append(Score(thesis_criteria_id=thesis_criteria_id, council_detail=council_detail,
+                                        score_number=score_number))
+
+        # bulk_create/bulk_update không phát signal nên tự lên lịch tính lại điểm một lần
+        # và invalidate như signal của Score (phân bố điểm theo tiêu chí đổi kể cả khi tổng điểm không đổi)
+        with transaction.atomic():
+            Score.objects.bulk_create(new_scores)
+            Score.objects.bulk_update(updated_scores, ['score_number'])
+            schedule_total_score(thesis.code)
+            caching.invalidate(f'thesis:{thesis.code}', stats.TAG)
+
+        serializer = serializers.ScoreSerializer(new_scores + updated_scores, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if new_scores else status.HTTP_200_OK)
+
 
 # Tiêu chí
-class CriteriaViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView, generics.DestroyAPIView):
+class CriteriaViewSet(caching.ConditionalListMixin, viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView,
+                      generics.DestroyAPIView):
     queryset = Criteria.objects.all()
     serializer_class = serializers.CriteriaSerializer
     parser_classes = [parsers.MultiPartParser]
@@ -872,16 +822,23 @@ class ThesisCriteriaViewSet(viewsets.ViewSet, generics.ListAPIView):
 
 # Bài đăng
 class PostViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
-    queryset = Post.objects.filter(active=True).order_by('-created_date')
+    queryset = (Post.objects.filter(active=True).select_related(*serializers.UserSerializer.related('user__'))
+                .order_by('-created_date', '-id'))
     serializer_class = serializers.PostSerializer
     parser_classes = [parsers.MultiPartParser]
     pagination_class = paginators.PostCommentPaginator
 
     def get_queryset(self):
         queryset = self.queryset
+
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user, active=True)))
+
         q = self.request.query_params.get('q')
         if q:
-            queryset = queryset.filter(content__icontains=q)
+            queryset = search.filter_queryset(queryset, q)
 
         return queryset
 
@@ -922,9 +879,10 @@ class PostViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
 
     @action(methods=['get'], url_path='comments', detail=True)
     def get_comments(self, request, pk):
-        comments = self.get_object().comment_set.select_related('user').order_by('-id')
+        comments = (self.get_object().comment_set.select_related(*serializers.UserSerializer.related('user__'))
+                    .order_by('-created_date', '-id'))
 
-        paginator = paginators.BasePaginator()
+        paginator = paginators.CommentPaginator()
         page = paginator.paginate_queryset(comments, request)
         if page is not None:
             serializer = serializers.CommentSerializer(page, many=True)
@@ -934,19 +892,30 @@ class PostViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
 
     @action(methods=['post'], url_path='comment', detail=True)
     def add_comment(self, request, pk):
-        c = self.get_object().comment_set.create(content=request.data.get('content'),
-                                                 user=request.user)
+        post = self.get_object()
+        with transaction.atomic():
+            c = post.comment_set.create(content=request.data.get('content'), user=request.user)
+            Post.objects.filter(pk=post.pk).update(comment_count=F('comment_count') + 1)
         return Response(serializers.CommentSerializer(c).data, status=status.HTTP_201_CREATED)
 
     @action(methods=['post'], url_path='like', detail=True)
     def like(self, request, pk):
-        post = self.get_object()
-        li, created = Like.objects.get_or_create(post=self.get_object(),
-                                                 user=request.user)
-        if not created:
-            li.active = not li.active
-            li.save()
+        with transaction.atomic():
+            # Khóa dòng Like: hai request cùng lúc (bấm đúp) không cùng đảo một trạng thái rồi cùng giảm bộ đếm
+            li, created = Like.objects.select_for_update().get_or_create(post=self.get_object(),
+                                                                         user=request.user)
+            if not created:
+                li.active = not li.active
+                li.save()
+
+            # Cập nhật số lượt thích bằng F() để tránh ghi đè khi nhiều người thích cùng lúc.
+            # Chỉ giảm khi bộ đếm > 0: cột UNSIGNED (MySQL) báo lỗi khi bộ đếm đã lệch về 0
+            if li.active:
+                Post.objects.filter(pk=li.post_id).update(like_count=F('like_count') + 1)
+            else:
+                Post.objects.filter(pk=li.post_id, like_count__gt=0).update(like_count=F('like_count') - 1)
 
+        post = self.get_object()  # Lấy lại để có số lượt thích và trạng thái liked mới
         context = {'request': request}
         serializer = serializers.AuthenticatedPost(post, context=context)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -961,6 +930,12 @@ class CommentViewSet(viewsets.ViewSet, generics.DestroyAPIView):
     pagination_class = paginators.PostCommentPaginator
     permission_classes = [perms.CommentOwner]
 
+    # Xóa comment và giảm số bình luận của bài đăng
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
     # Sửa comment
     def partial_update(self, request, pk=None):
         cmt = self.get_object()
@@ -975,28 +950,91 @@ class CommentViewSet(viewsets.ViewSet, generics.DestroyAPIView):
 class ThesisStatsViewSet(viewsets.ViewSet):
     permission_classes = [perms.IsMinistry]
 
+    # Đọc từ bảng thống kê ThesisStat (cập nhật dần khi điểm/kết quả khóa luận thay đổi)
     def list(self, request):
-        avg_score_by_school_year = Thesis.objects.values(
-            'school_year__start_year', 'school_year__end_year'
-        ).annotate(
-            start_year=ExtractYear('school_year__start_year'),
-            end_year=ExtractYear('school_year__end_year'),
-            avg_score=Avg('total_score')
-        )
-
-        for item in avg_score_by_school_year:
-            if item['avg_score'] is not None:
-                item['avg_score'] = round(item['avg_score'], 2)
-
-        thesis_major_count = Major.objects.annotate(
-            major_name=F('name'),
-            thesis_count=Count('thesis')
-        )
-
-        avg_score_serializer = serializers.ThesisStatsSerializer(avg_score_by_school_year, many=True)
-        thesis_count_serializer = serializers.MajorThesisCountSerializer(thesis_major_count, many=True)
+        avg_score_serializer = serializers.ThesisStatsSerializer(stats.by_school_year(), many=True)
+        thesis_count_serializer = serializers.MajorThesisCountSerializer(stats.count_by_major(), many=True)
 
         return Response({
             'avg_score_by_school_year': avg_score_serializer.data,
             'thesis_major_count': thesis_count_serializer.data
-        })
\ No newline at end of file
+        })
+
+    # Phân bố điểm: /stats/distribution/?school_year=<id>&major=<mã>&criteria=<id>&bucket=<độ rộng khoảng>
+    # Không có criteria: điểm tổng của khóa luận, có criteria: điểm của tiêu chí đó
+    @action(methods=['get'], url_path='distribution', detail=False)
+    def distribution(self, request):
+        params = request.query_params
+        try:
+            school_year_id = int(params['school_year']) if params.get('school_year') else None
+            criteria_id = int(params['criteria']) if params.get('criteria') else None
+        except ValueError:
+            return Response({'Thông báo': 'Mã năm học, tiêu chí phải là số nguyên!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bucket_size = float(params.get('bucket', 1))
+        except ValueError:
+            bucket_size = 0
+        if not 0.1 <= bucket_size <= stats.MAX_SCORE:
+            return Response({'Thông báo': f'Độ rộng khoảng phải từ 0.1 đến {stats.MAX_SCORE}!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        major_id = params.get('major') or None
+
+        key = f'distribution:{school_year_id}:{major_id}:{criteria_id}:{bucket_size}'
+        return Response(caching.cached(key, [stats.TAG], lambda: stats.distribution(
+            school_year_id=school_year_id, major_id=major_id, criteria_id=criteria_id, bucket_size=bucket_size)))
+
+
+# Tìm kiếm chung: /search/?q=...&type=thesis,post,lecturer,student
+class SearchViewSet(viewsets.ViewSet):
+    def list(self, request):
+        q = request.query_params.get('q', '')
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+
+        valid_kinds = [kind for kind, name in SearchEntry.Kind_choice]
+        if any(kind not in valid_kinds for kind in kinds):
+            return Response({'Thông báo': f'Loại tìm kiếm phải thuộc: {", ".join(valid_kinds)}!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 50)
+        except ValueError:
+            return Response({'Thông báo': 'Số kết quả phải là số nguyên!'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = search.matching(q, kinds)
+        if entries is None:
+            return Response({'Thông báo': 'Từ khóa tìm kiếm không được bỏ trống!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        entries = entries.order_by('-rank', '-updated_date')[:max(limit, 1)]
+        return Response(serializers.SearchEntrySerializer(entries, many=True).data)
+
+
+# Gợi ý sinh viên, giảng viên theo mã hoặc họ tên khi nhập: /autocomplete/?q=...&type=student
+# Tra trên chỉ mục trong bộ nhớ, không truy vấn cơ sở dữ liệu
+class AutocompleteViewSet(viewsets.ViewSet):
+    def list(self, request):
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        if any(kind not in autocomplete.KINDS.values() for kind in kinds):
+            return Response({'Thông báo': f'Loại gợi ý phải thuộc: {", ".join(autocomplete.KINDS.values())}!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'Thông báo': 'Số kết quả phải là số nguyên!'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(autocomplete.lookup(request.query_params.get('q', ''), kinds, limit))
+
+
+# Số liệu truy vấn và thời gian xử lý theo từng view action (bật bằng PROFILING_ENABLED)
+class ProfilingViewSet(viewsets.ViewSet):
+    permission_classes = [perms.IsMinistry]
+
+    def list(self, request):
+        return Response({'enabled': settings.PROFILING_ENABLED, 'actions': profiling.snapshot()})
+
+    @action(methods=['post'], url_path='reset', detail=False)
+    def reset(self, request):
+        profiling.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
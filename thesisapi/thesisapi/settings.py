@@ -57,10 +57,34 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'theses.authentication.CachedOAuth2Authentication',
     )
 }
 
+# Phiên bản dữ liệu (caching.model_versions), tag của kết quả được cache, phiên bản user của token đều nằm trong cache.
+# LocMemCache (mặc định) riêng từng process: chỉ đúng khi chạy một process; thay đổi ở worker này không làm mới
+# cache của worker khác (gunicorn/uwsgi nhiều worker). Khi chạy nhiều process đặt CACHE_REDIS_URL
+# (vd. redis://localhost:6379/1, cần gói redis) để mọi process dùng chung Redis.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Token OAuth2 đã xác thực được cache (kèm user và vai trò) tối đa số giây này, không quá thời hạn của token
+OAUTH2_TOKEN_CACHE_TIMEOUT = 300
+
+# Thời gian (giây) client, proxy được dùng lại danh sách dữ liệu danh mục (vị trí, năm học, ngành, tiêu chí)
+# trước khi hỏi lại máy chủ bằng ETag
+REFERENCE_DATA_MAX_AGE = 60
+
+# Thời gian tối đa (giây) giữ kết quả truy vấn được cache theo tag (theses/caching.py)
+QUERY_CACHE_TIMEOUT = 300
+
 CKEDITOR_UPLOAD_PATH = "ckeditor/images/"
 
 MEDIA_ROOT = '%s/theses/static/' % BASE_DIR
@@ -68,6 +92,7 @@ MEDIA_ROOT = '%s/theses/static/' % BASE_DIR
 AUTH_USER_MODEL = 'theses.User'
 
 MIDDLEWARE = [
+    'theses.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +104,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
+# Đo số truy vấn/thời gian theo view action, trả về header Server-Timing (tắt thì middleware không chạy)
+PROFILING_ENABLED = False
+
 ROOT_URLCONF = 'thesisapi.urls'
 
 TEMPLATES = [
@@ -172,6 +200,21 @@ EMAIL_USE_TLS = True
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Email được lưu vào bảng outbox rồi gửi theo lô (lệnh send_outbox), tự gửi ở thread nền sau khi commit
+EMAIL_OUTBOX_AUTO_SEND = True
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # Giây, nhân đôi sau mỗi lần gửi lỗi
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600  # Giây; email đã được worker nhận nhưng chưa ghi kết quả sẽ đến hạn lại sau đó
+
+# Tính lại điểm khóa luận: 'deferred' (gộp và tính sau khi transaction commit) hoặc 'sync' (tính ngay, dùng khi test)
+SCORE_RECOMPUTE_MODE = 'deferred'
+
+# Xuất phiếu chấm điểm PDF: 'async' (worker pool trong process) hoặc 'sync' (render ngay trong request)
+SCORE_SHEET_RENDER_MODE = 'async'
+SCORE_SHEET_WORKERS = 2
+SCORE_SHEET_PROCESSES = 2  # Số process render khi xuất hàng loạt (0: render trong process hiện tại)
+SCORE_SHEET_JOB_TIMEOUT = 300  # Job chờ/đang xử lý quá số giây này được đưa lại vào hàng đợi
+
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]